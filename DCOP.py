@@ -1,42 +1,316 @@
 import numpy as np
 import random
-import copy
+import os
+import json
+import shutil
+import hashlib
+from collections import namedtuple
+from multiprocessing import shared_memory
 
 
 
 # Build cost matrix between two agents, either random or graph-coloring
-def create_constraint_matrix(domain_size,low_val=1, high_val=10,p2=1):
+def create_constraint_matrix(domain_size,low_val=1, high_val=10,p2=1, rng=random):
     matrix = [[0] * domain_size for _ in range(domain_size)]
     for i in range(domain_size):
         for j in range(domain_size):
-                if random.random() <= p2:
-                    matrix[i][j] = random.randint(low_val, high_val)
+                if rng.random() <= p2:
+                    matrix[i][j] = rng.randint(low_val, high_val)
     return np.array(matrix)
 
 
+# ------------------------------------------------ Instance Sampling ---------------------------------------------------
+
+# Changes whenever the same parameters and seed start producing different instances (InstanceStore keys include it)
+GENERATOR_VERSION = 3
+
+# Range of the costs create_constraint_matrix / sample_cost_tensor draw (0 where p2 leaves a cell empty)
+COST_RANGE = (1, 10)
+
+
+# Smallest integer dtype holding every cost in [low, high] (uint8 for the 0..10 costs here, uint8 for p.py's
+# 100..200). Costs are stored in it; anything that adds or subtracts costs widens to int64 first.
+def cost_dtype(low, high):
+    return np.promote_types(np.min_scalar_type(low), np.min_scalar_type(high))
+
+
+# Erdős–Rényi edges (i, j), i < j, each pair independently with probability p1, in time proportional to the number of
+# edges: pairs are numbered row by row over the upper triangle and the gaps between chosen pairs are geometric.
+def sample_edges(num_agents, p1, rng):
+    num_pairs = num_agents * (num_agents - 1) // 2
+    if p1 <= 0 or num_pairs == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    chosen = []
+    last = -1
+    while last < num_pairs:
+        # Enough gaps to pass the last pair most of the time, at least a few thousand per draw
+        expected = (num_pairs - last) * min(p1, 1.0)
+        gaps = rng.geometric(min(p1, 1.0), size=int(expected + 5 * np.sqrt(expected) + 1000))
+        pairs = last + np.cumsum(gaps)
+        chosen.append(pairs[pairs < num_pairs])
+        last = pairs[-1]
+    pairs = np.concatenate(chosen)
+
+    # Row i of the triangle starts at pair i * (2n - i - 1) / 2
+    i = np.arange(num_agents, dtype=np.int64)
+    starts = i * (2 * num_agents - i - 1) // 2
+    rows = np.searchsorted(starts, pairs, side='right') - 1
+    return np.stack((rows, pairs - starts[rows] + rows + 1), axis=1)
+
+
+# All cost matrices at once, as create_constraint_matrix fills them: each cell is uniform in [low_val, high_val]
+# with probability p2 and 0 otherwise
+def sample_cost_tensor(num_edges, domain_size, rng, p2=1, low_val=1, high_val=10):
+    shape = (num_edges, domain_size, domain_size)
+    costs = rng.integers(low_val, high_val + 1, size=shape, dtype=cost_dtype(min(low_val, 0), high_val))
+    if p2 < 1:
+        costs[rng.random(shape) > p2] = 0
+    return costs
+
+
+# Symmetric graph-coloring style matrices (p.py): uniform costs in [low_val, high_val] on the diagonal (same value
+# for both agents) and 0 elsewhere, or with coloring=False uniform costs in every cell, mirrored across the diagonal
+def sample_coloring_tensor(num_edges, domain_size, rng, coloring=True, low_val=100, high_val=200):
+    dtype = cost_dtype(min(low_val, 0), high_val)
+    if coloring:
+        costs = np.zeros((num_edges, domain_size, domain_size), dtype=dtype)
+        diagonal = np.arange(domain_size)
+        costs[:, diagonal, diagonal] = rng.integers(low_val, high_val + 1, size=(num_edges, domain_size), dtype=dtype)
+        return costs
+    costs = np.triu(rng.integers(low_val, high_val + 1, size=(num_edges, domain_size, domain_size), dtype=dtype))
+    return costs + np.triu(costs, 1).transpose(0, 2, 1)
+
+
+
+# Picklable handle of an instance whose arrays live in shared memory; edges/cost_tensor are (name, shape, dtype),
+# csr the same for csr_offsets, csr_neighbors, csr_edges and csr_transposed (attached instead of rebuilt)
+SharedInstance = namedtuple('SharedInstance', ['num_agents', 'domain_size', 'p1', 'p2', 'seed', 'edges', 'cost_tensor',
+                                               'csr'])
+CSR_ARRAYS = ('csr_offsets', 'csr_neighbors', 'csr_edges', 'csr_transposed')
+
+
+def share_array(array):
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def attach_array(spec):
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, np.dtype(dtype), buffer=shm.buf)
+
+
+# write(tmp_path) writes a file or directory next to `path`, which is then renamed into place, so readers never see a
+# partial one. A directory that is already at `path` (someone else saved the same thing first) is kept.
+def atomic_write(path, write):
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except OSError:
+        if not (os.path.isdir(tmp_path) and os.path.isdir(path)):
+            raise
+    finally:
+        if os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path)
+        elif os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 
 class DCOPInstance:
     # Initialize instances with given parameters
-    def __init__(self, num_agents, domain_size, p1,p2, seed):
-        random.seed(seed)
-        np.random.seed(seed)
+    # Generated from a NumPy Generator of its own seeded with `seed`, in time proportional to the number of
+    # constraints, so creating an instance leaves the global random state alone
+    # memory_budget: bytes; raise MemoryError before generating anything if the expected footprint exceeds it
+    def __init__(self, num_agents, domain_size, p1,p2, seed, memory_budget=None):
+        if memory_budget is not None:
+            check_memory_budget(self.estimate_memory(num_agents, domain_size, p1, p2), memory_budget)
+        rng = np.random.default_rng(seed)
+        self.seed = seed
+        self.p1 = p1
+        self.p2 = p2
+
+        # Construct random constrains with probability p1 and assign cost matrices
+        edges = sample_edges(num_agents, p1, rng)
+        matrices = sample_cost_tensor(len(edges), domain_size, rng, p2)
+        self.set_constraints(num_agents, domain_size, edges, matrices)
+
+    # Build an instance around existing constraint arrays (no generation, no copy of cost_tensor)
+    # csr: the CSR_ARRAYS of these edges when already built, e.g. in shared memory
+    @classmethod
+    def from_arrays(cls, num_agents, domain_size, edges, cost_tensor, p1=None, p2=None, seed=None, csr=None):
+        instance = cls.__new__(cls)
+        instance.seed = seed
+        instance.p1 = p1
+        instance.p2 = p2
+        instance.set_constraints(num_agents, domain_size, edges, cost_tensor, csr)
+        return instance
+
+    # Copy the constraint arrays into shared memory; the caller owns (closes and unlinks) the returned blocks
+    def to_shared_memory(self):
+        blocks, specs = zip(*[share_array(array) for array in [self.edges, self.cost_tensor]
+                              + [getattr(self, name) for name in CSR_ARRAYS]])
+        handle = SharedInstance(self.num_agents, self.domain_size, self.p1, self.p2, self.seed, specs[0], specs[1],
+                                specs[2:])
+        return handle, list(blocks)
+
+    # Instance backed by the shared blocks of `handle`; keep the returned blocks alive while it is in use
+    @classmethod
+    def from_shared_memory(cls, handle):
+        blocks, arrays = zip(*[attach_array(spec) for spec in (handle.edges, handle.cost_tensor) + tuple(handle.csr)])
+        instance = cls.from_arrays(handle.num_agents, handle.domain_size, arrays[0], arrays[1],
+                                   p1=handle.p1, p2=handle.p2, seed=handle.seed, csr=arrays[2:])
+        return instance, list(blocks)
+
+    # Write the instance as a directory: edges.npy, cost_tensor.npy and the generation parameters in params.json.
+    # Written with atomic_write, so readers never see a partial instance.
+    def save(self, path):
+        def write(tmp_path):
+            os.makedirs(tmp_path, exist_ok=True)
+            np.save(os.path.join(tmp_path, "edges.npy"), self.edges)
+            np.save(os.path.join(tmp_path, "cost_tensor.npy"), self.cost_tensor)
+            params = {"num_agents": self.num_agents, "domain_size": self.domain_size,
+                      "p1": self.p1, "p2": self.p2, "seed": self.seed}
+            with open(os.path.join(tmp_path, "params.json"), "w") as f:
+                json.dump(params, f)
+        atomic_write(path, write)
+
+    # Load a saved instance; with mmap the cost tensor is memory-mapped instead of read into memory
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(os.path.join(path, "params.json")) as f:
+            params = json.load(f)
+        mode = 'r' if mmap else None
+        edges = np.load(os.path.join(path, "edges.npy"), mmap_mode=mode)
+        cost_tensor = np.load(os.path.join(path, "cost_tensor.npy"), mmap_mode=mode)
+        return cls.from_arrays(params["num_agents"], params["domain_size"], edges, cost_tensor,
+                               p1=params["p1"], p2=params["p2"], seed=params["seed"])
+
+    # One matrix per constraint, rows belong to edges[e][0]. Integer costs are stored in the smallest integer dtype
+    # that holds them (tensors already 1 or 2 bytes per cost, e.g. loaded or in shared memory, are kept as they are);
+    # any other dtype is kept unchanged, as narrowing it would lose costs.
+    def set_constraints(self, num_agents, domain_size, edges, cost_tensor, csr=None):
         self.num_agents = num_agents
         self.domain_size = domain_size
         self.domain = list(range(domain_size))
-        self.neighbors_map = {i: [] for i in range(self.num_agents)}  # Adjacency list
-        self.cost_matrices = {i: {} for i in range(self.num_agents)}  # Pairwise cost matrices
+        self.edges = np.asarray(edges, dtype=np.int64).reshape(len(edges), 2)
+        cost_tensor = np.asarray(cost_tensor)
+        if np.issubdtype(cost_tensor.dtype, np.integer) and cost_tensor.dtype.itemsize > 2 and cost_tensor.size:
+            cost_tensor = cost_tensor.astype(cost_dtype(cost_tensor.min(), cost_tensor.max()))
+        self.cost_tensor = cost_tensor.reshape(len(self.edges), domain_size, domain_size)
+        self.cost_tensor.flags.writeable = False
+        self._neighbors_map = None
+        self._cost_matrices = None
+        if csr is None:
+            self.build_csr()
+        else:
+            for name, array in zip(CSR_ARRAYS, csr):
+                setattr(self, name, array)
+
+    # Adjacency lists and per-agent dicts of read-only views into cost_tensor (cost matrix from j to i is the
+    # transposed view of the matrix from i to j, each variable sees itself as the rows). Only the agent objects use
+    # them, so they are built on first access: two dict entries per constraint cost more than a compact cost tensor.
+    @property
+    def neighbors_map(self):
+        if self._neighbors_map is None:
+            self.build_maps()
+        return self._neighbors_map
+
+    @property
+    def cost_matrices(self):
+        if self._cost_matrices is None:
+            self.build_maps()
+        return self._cost_matrices
+
+    def build_maps(self):
+        self._neighbors_map = {i: [] for i in range(self.num_agents)}  # Adjacency list
+        self._cost_matrices = {i: {} for i in range(self.num_agents)}  # Pairwise cost matrices
+        for e, (i, j) in enumerate(self.edges.tolist()):
+            self._neighbors_map[i].append(j)
+            self._neighbors_map[j].append(i)
+            self._cost_matrices[i][j] = self.cost_tensor[e]
+            self._cost_matrices[j][i] = self.cost_tensor[e].T
+
+    # Bytes held by the instance's arrays (memory-mapped tensors count their full size)
+    def memory_footprint(self):
+        footprint = {
+            "cost_tensor": self.cost_tensor.nbytes,
+            "edges": self.edges.nbytes,
+            "csr": sum(array.nbytes for array in (self.csr_offsets, self.csr_neighbors, self.csr_edges,
+                                                   self.csr_transposed)),
+        }
+        footprint["total"] = sum(footprint.values())
+        return footprint
+
+    # memory_footprint() an instance with these parameters is expected to have, before generating it
+    @staticmethod
+    def estimate_memory(num_agents, domain_size, p1, p2=1):
+        num_edges = round(p1 * num_agents * (num_agents - 1) / 2)
+        low, high = COST_RANGE
+        itemsize = cost_dtype(0 if p2 < 1 else low, high).itemsize
+        footprint = {
+            "cost_tensor": num_edges * domain_size * domain_size * itemsize,
+            "edges": num_edges * 2 * 8,
+            "csr": (num_agents + 1) * 8 + 2 * num_edges * (8 + 8 + 1),
+        }
+        footprint["total"] = sum(footprint.values())
+        return footprint
+
+    # CSR adjacency: the neighbors of agent i are csr_neighbors[csr_offsets[i]:csr_offsets[i + 1]] (ascending),
+    # csr_edges gives the constraint index of each entry and csr_transposed is True where agent i is the column
+    # side of cost_tensor[e]
+    def build_csr(self):
+        num_edges = len(self.edges)
+        agents = np.concatenate((self.edges[:, 0], self.edges[:, 1]))
+        others = np.concatenate((self.edges[:, 1], self.edges[:, 0]))
+        order = np.lexsort((others, agents))
+        self.csr_offsets = np.concatenate(([0], np.cumsum(np.bincount(agents, minlength=self.num_agents))))
+        self.csr_neighbors = others[order]
+        self.csr_edges = np.concatenate((np.arange(num_edges), np.arange(num_edges)))[order]
+        self.csr_transposed = np.concatenate((np.zeros(num_edges, dtype=bool), np.ones(num_edges, dtype=bool)))[order]
+
+
+# The simulations add and subtract costs as int64 (global costs, histories, cost deltas); other costs would be
+# truncated, so they refuse instances whose costs are not integers
+def check_integer_costs(DCOP):
+    if not np.issubdtype(DCOP.cost_tensor.dtype, np.integer):
+        raise ValueError(f"Costs must be integers to simulate, not {DCOP.cost_tensor.dtype}")
+
+
+# MemoryError when a footprint (memory_footprint / estimate_memory) is over `budget` bytes
+def check_memory_budget(footprint, budget):
+    if footprint["total"] > budget:
+        raise MemoryError(f"Instance needs about {footprint['total'] / 2**20:.1f} MiB "
+                          f"(cost tensor {footprint['cost_tensor'] / 2**20:.1f} MiB), "
+                          f"over the budget of {budget / 2**20:.1f} MiB")
+
+
+# On-disk cache of generated instances, one directory per (num_agents, domain_size, p1, p2, seed)
+class InstanceStore:
+    def __init__(self, root, mmap=True):
+        self.root = root
+        self.mmap = mmap
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(num_agents, domain_size, p1, p2, seed):
+        params = json.dumps([int(num_agents), int(domain_size), float(p1), float(p2), int(seed), GENERATOR_VERSION])
+        return hashlib.sha1(params.encode()).hexdigest()[:16]
+
+    def path(self, num_agents, domain_size, p1, p2, seed):
+        return os.path.join(self.root, self.key(num_agents, domain_size, p1, p2, seed))
+
+    def __contains__(self, params):
+        return os.path.isdir(self.path(*params))
+
+    # Load the instance if it was stored before, otherwise generate and store it
+    def get(self, num_agents, domain_size, p1, p2, seed):
+        path = self.path(num_agents, domain_size, p1, p2, seed)
+        if not os.path.isdir(path):
+            DCOPInstance(num_agents, domain_size, p1, p2, seed).save(path)
+        return DCOPInstance.load(path, mmap=self.mmap)
 
-        # Construct random constrains with probability p1 and assign cost matrices
-        # Cost matrix from j to i is the transpose of cost matrix from i to j.
-        # Assume each variable see itself as the rows of the matrix.
-        for i in range(self.num_agents):
-            for j in range(i + 1, self.num_agents):
-                if random.random() < p1:
-                    self.neighbors_map[i].append(j)
-                    self.neighbors_map[j].append(i)
-                    matrix = create_constraint_matrix(domain_size=domain_size,p2=p2)
-                    self.cost_matrices[i][j] = np.array(matrix)
-                    self.cost_matrices[j][i] = np.array(np.transpose(matrix))
 
 if __name__ == "__main__":
     print(create_constraint_matrix(5))
@@ -1,34 +1,97 @@
 import random
 import numpy as np
-from jsonschema.exceptions import best_match
-from networkx.classes import neighbors
+from streams import ACCEPT, PICK
 
 
 # Message class
 class Message:
+    __slots__ = ('sender_id', 'receiver_id', 'value', 'iteration', 'type')
+
     def __init__(self, sender_id, receiver_id, value, iteration,msg_type):
         self.sender_id = sender_id
         self.receiver_id = receiver_id
         self.value = value
         self.iteration = iteration
         self.type = msg_type
-        self.read = False
+
+# Received messages indexed by iteration -> type -> sender id.
+# Agents only read the previous iteration, so at most a couple of rounds are alive and a stale round is dropped
+# as a whole. Senders are kept in arrival order.
+class Mailbox:
+    __slots__ = ('rounds',)
+
+    def __init__(self):
+        self.rounds = {}
+
+    def append(self, message):
+        self.rounds.setdefault(message.iteration, {}).setdefault(message.type, {})[message.sender_id] = message
+
+    # Messages of one type sent at `iteration`, keyed by sender id
+    def get(self, iteration, msg_type):
+        return self.rounds.get(iteration, {}).get(msg_type, {})
+
+    def get_from(self, iteration, msg_type, sender_id):
+        return self.get(iteration, msg_type).get(sender_id)
+
+    # Latest message of one type from each sender over all rounds before `iteration`
+    def latest(self, msg_type, iteration):
+        merged = {}
+        for it in sorted(self.rounds):
+            if it < iteration:
+                merged.update(self.rounds[it].get(msg_type, {}))
+        return merged
+
+    # Free every round older than `iteration`
+    def clear_before(self, iteration):
+        for stale in [it for it in self.rounds if it < iteration]:
+            del self.rounds[stale]
+
+    def __iter__(self):
+        for by_type in self.rounds.values():
+            for by_sender in by_type.values():
+                yield from by_sender.values()
+
+    def __len__(self):
+        return sum(len(by_sender) for by_type in self.rounds.values() for by_sender in by_type.values())
 
 # Base class for agents
 class Agent():
+    # Methods a Profiler (instrumentation.py) times when attached
+    PROFILED_METHODS = ('compute_costs_from_last_it', 'clear_read_messages', 'get_best_value', 'send_messages')
 
     def __init__(self, agent_id, domain_size):
         self.id = agent_id
         self.domain = range(domain_size)
         self.value = self.set_initial_value(self.domain)
         self.neighbors = []  # List of neighboring Agent instances
-        self.mailbox = []  # Received messages buffer
+        self.mailbox = Mailbox()  # Received messages buffer
         self.cost_matrices = {}  # Cost matrices keyed by neighbor ID
         self.iteration = 0
         self.current_costs = np.full(domain_size, np.inf)
-
+        self.neighbor_values = {}  # Last value received from each neighbor
+        self.local_costs = np.zeros(domain_size, dtype=np.int64)  # Cost of each value given neighbor_values
+        self.streams = None  # RandomStreams to draw from instead of the global random module
+        self.round = 0  # Simulation iteration being performed, which selects the streams' block
+        # Active-set scheduling (Simulation(..., active_set=True)): only send a message type when its content
+        # changed, receivers keep the last one; has_alternatives tells the scheduler the agent may still move
+        self.quiet = False
+        self.sent = {}
+        self.has_alternatives = True
+
+    # Uniform in [0, 1): from this agent's stream when it has one
+    def draw_uniform(self):
+        if self.streams is None:
+            return random.random()
+        return self.streams.agent_draws(self.round)[self.id][ACCEPT]
+
+    def draw_choice(self, options):
+        if self.streams is None:
+            return random.choice(options)
+        return options[min(int(self.streams.agent_draws(self.round)[self.id][PICK] * len(options)), len(options) - 1)]
+
+    # Everything before the current iteration has been read by now
     def clear_read_messages(self):
-        self.mailbox = [msg for msg in self.mailbox if not msg.read]
+        self.mailbox.clear_before(self.iteration)
 
     # Set a random initial value from the domain
     def set_initial_value(self, domain):
@@ -37,25 +100,36 @@ class Agent():
     def send_messages(self, argument=None, msg_type="value"):
         if argument is None:
             argument = self.value
+        if self.quiet:
+            if msg_type in self.sent and self.sent[msg_type] == argument:
+                return
+            self.sent[msg_type] = argument
         for neighbor in self.neighbors:
             message = Message(self.id, neighbor.id, argument, self.iteration, msg_type)
             neighbor.mailbox.append(message)
 
+    # Value messages go to every neighbor each round (with quiet agents: whenever the value changed), so patching
+    # local_costs for the neighbors that moved gives the same vector as summing all of last round's messages from
+    # scratch. Before any value arrived (MGM2's first cycle) the costs are all zero.
     def compute_costs_from_last_it(self):
-        costs = []
-        for value in self.domain:
-            cost = 0
-            for message in self.mailbox:
-                if (message.iteration == self.iteration - 1) and (message.type=="value") :
-                    message.read = True
-                    neighbor_id = message.sender_id
-                    neighbor_value = message.value
-                    matrix = self.cost_matrices[neighbor_id]
-                    i = self.domain.index(value)
-                    j = self.domain.index(neighbor_value)
-                    cost += matrix[i][j]
-            costs.append(cost)
-        self.current_costs = costs
+        messages = self.mailbox.get(self.iteration - 1, "value")
+        for neighbor_id, message in messages.items():
+            self.update_neighbor_value(neighbor_id, message.value)
+        if messages or self.neighbor_values:
+            self.current_costs = self.local_costs.copy()
+        else:
+            self.current_costs = np.zeros(len(self.domain), dtype=np.int64)
+
+    # Apply the row delta of a neighbor's cost matrix when its value changes
+    def update_neighbor_value(self, neighbor_id, value):
+        old_value = self.neighbor_values.get(neighbor_id)
+        if old_value == value:
+            return
+        matrix = self.cost_matrices[neighbor_id]
+        if old_value is not None:
+            self.local_costs -= matrix[:, old_value]
+        self.local_costs += matrix[:, value]
+        self.neighbor_values[neighbor_id] = value
 
     # Decide whether to update assignment based on best local improvement and probability p
     def get_best_value(self,prob=1):
@@ -68,13 +142,14 @@ class Agent():
                 if c == min_cost
             ]
             best_values_minus_current = [v for v in best_values if v != self.value]
+            self.has_alternatives = bool(best_values_minus_current)
             if prob == 1:
                 if best_values_minus_current:
-                    best_value = random.choice(best_values_minus_current)
+                    best_value = self.draw_choice(best_values_minus_current)
             else:
-                if random.random() < prob:
+                if self.draw_uniform() < prob:
                     if best_values_minus_current:
-                        best_value =  random.choice(best_values_minus_current)
+                        best_value =  self.draw_choice(best_values_minus_current)
 
         return best_value
 
@@ -88,6 +163,8 @@ class Agent():
 
 # Agent for the DSA algorithm
 class DSAAgent(Agent):
+    PROFILED_METHODS = Agent.PROFILED_METHODS + ('perform_phase1',)
+
     # Initialize DSA agent with probability p for accepting a new lower-cost value
     def __init__(self, agent_id, domainsize, p_dsa=0.7):
         super().__init__(agent_id, domainsize)
@@ -98,25 +175,46 @@ class DSAAgent(Agent):
         value = self.get_best_value(self.p_dsa)
         self.value = value
 
+    # Everything this agent does in one synchronous iteration
+    def perform_round(self, iteration):
+        self.iteration = iteration
+        self.round = iteration
+        self.compute_costs_from_last_it()
+        self.perform_phase1()
+        self.clear_read_messages()
+        self.send_messages()
+
 # Agent for the MGM algorithm
 class MGMAgent(Agent):
+    PROFILED_METHODS = Agent.PROFILED_METHODS + ('perform_phase1', 'perform_phase2', 'decide_to_change')
+
     def __init__(self, agent_id, domain):
         super().__init__(agent_id, domain)
         self.best_gain = 0  # Best gain from changing value
         self.best_value = self.value  # Value that yields best gain
         self.phase1_messages = []  # Messages to send in phase 1
         self.reduction = 0
+        self.neighbor_reductions = {}  # Last reduction received from each neighbor
+
+    # Every neighbor sends its reduction each cycle (quiet agents: when it changed), so the last one received from
+    # each neighbor is the one of last round
+    def read_reductions(self):
+        for sender_id, message in self.mailbox.latest("reduction", self.iteration).items():
+            self.neighbor_reductions[sender_id] = message.value
+
+    def clear_read_messages(self):
+        self.read_reductions()
+        super().clear_read_messages()
 
     def decide_to_change(self):
+        self.read_reductions()
         maximal = True
-        for message in self.mailbox:
-            message.read = True
-            if (message.iteration == self.iteration-1) and (message.type=="reduction"):
-                if self.reduction < message.value:
+        for sender_id, reduction in self.neighbor_reductions.items():
+            if self.reduction < reduction:
+                maximal = False
+            elif self.reduction == reduction:
+                if sender_id < self.id:
                     maximal = False
-                elif self.reduction == message.value:
-                    if message.sender_id < self.id:
-                        maximal = False
         return maximal
 
     def perform_phase1(self):
@@ -130,8 +228,24 @@ class MGMAgent(Agent):
             self.value = best_alternative_value
         self.send_messages(argument=self.value, msg_type="value")
 
+    # Odd iterations exchange reductions, even iterations decide
+    def perform_round(self, iteration):
+        self.iteration = iteration
+        self.round = iteration
+        if iteration % 2 == 1:
+            self.compute_costs_from_last_it()
+            self.perform_phase1()
+            self.clear_read_messages()
+            self.send_messages()
+        else:
+            self.perform_phase2()
+
 # Agent for the MGM-2 algorithm
 class MGM2Agent(MGMAgent):
+    PROFILED_METHODS = MGMAgent.PROFILED_METHODS + ('perform_phase3', 'perform_phase4', 'perform_phase5',
+                                                    'compute_best_pair_assignment', 'compute_unary_costs',
+                                                    'decide_to_change_partner', 'send_message_to_specific_agent')
+
     def __init__(self, agent_id, domain):
         super().__init__(agent_id, domain)
         self.potential_partner = None
@@ -159,87 +273,86 @@ class MGM2Agent(MGMAgent):
         message = Message(self.id, receiver.id, argument, self.iteration, msg_type)
         receiver.mailbox.append(message)
 
+    # In sender order, as they arrive when agents run one after the other; delivery order (AsyncRuntime) must not
+    # change which proposal is drawn
     def get_last_proposals(self):
-        proposal_recieved = []
-        for message in self.mailbox:
-            if (message.iteration == self.iteration-1) and (message.type=="proposal"):
-                message.read = True
-                proposal_recieved.append(message)
-        return proposal_recieved
+        return sorted(self.mailbox.get(self.iteration-1, "proposal").values(), key=lambda message: message.sender_id)
 
     def get_partner_object(self,desired_proposal):
         return next((neighbor for neighbor in self.neighbors if neighbor.id == desired_proposal.sender_id), None)
 
-    def compute_cost(self, value):
-        cost = 0
-        for k, neighbor in enumerate(self.neighbors):
-            neighbor_value = neighbor.value
-            cost += self.cost_matrices[neighbor.id][self.domain.index(value)][self.domain.index(neighbor_value)]
-        return cost
-
-    def compute_best_pair_assignment(self, partner):
-        best_cost = float('inf')
-        best_assignment = (self.value, partner.value)
-        for v1 in self.domain:
-            for v2 in partner.domain:
-                c1 = self.compute_cost(v1)
-                c2 = partner.compute_cost(v2)
-                total_cost = c1 + c2
-                if total_cost < best_cost:
-                    best_cost = total_cost
-                    best_assignment = {self.id:v1, partner.id:v2}
-        reduction = self.compute_cost(self.value) + partner.compute_cost(partner.value) - best_cost
+    # Local cost vector given the neighbors' current values: the running local_costs once every neighbor has
+    # reported a value, otherwise (first cycle) summed from the neighbors directly
+    def compute_unary_costs(self):
+        if len(self.neighbor_values) == len(self.neighbors):
+            return self.local_costs
+        costs = np.zeros(len(self.domain), dtype=np.int64)
+        for neighbor in self.neighbors:
+            costs += self.cost_matrices[neighbor.id][:, neighbor.value]
+        return costs
+
+    # Joint cost of every (my value, partner value) pair as one d x d array: both unary vectors without the
+    # constraint between the partners, plus that constraint counted once. partner_costs: the unary costs the partner
+    # sent with its proposal
+    def compute_best_pair_assignment(self, partner, partner_costs):
+        shared = self.cost_matrices[partner.id]
+        mine = self.compute_unary_costs() - shared[:, partner.value]
+        theirs = partner_costs - shared[self.value, :]
+        joint = mine[:, None] + theirs[None, :] + shared
+        v1, v2 = np.unravel_index(np.argmin(joint), joint.shape)
+        best_assignment = {self.id: int(v1), partner.id: int(v2)}
+        reduction = joint[self.value, partner.value] - joint[v1, v2]
         return best_assignment, reduction
 
+    # A proposer learns from the reply that its proposal was accepted
     def update_reduction_and_best_pair_assignment_from_message(self):
-        for message in self.mailbox:
-            if (message.iteration == self.iteration-1) and (message.type=="p2mgm2") and (message.sender_id == self.partner.id):
-                message.read = True
-                self.best_pair_assignment = message.value[0]
-                self.reduction = message.value[1]
+        message = self.mailbox.get_from(self.iteration-1, "p2mgm2", self.potential_partner.id)
+        if message is not None:
+            self.partner = self.potential_partner
+            self.best_pair_assignment = message.value[0]
+            self.reduction = message.value[1]
 
     def decide_to_change_partner(self):
         maximal = True
-        for message in self.mailbox:
-            if (message.iteration == self.iteration-1) and (message.type=="reduction"):
-                message.read = True
-                if message.sender_id == self.partner.id:
-                    continue
-                if self.reduction < message.value:
+        for message in self.mailbox.get(self.iteration-1, "reduction").values():
+            if message.sender_id == self.partner.id:
+                continue
+            if self.reduction < message.value:
+                maximal = False
+            elif self.reduction == message.value:
+                if message.sender_id < self.id:
                     maximal = False
-                elif self.reduction == message.value:
-                    if message.sender_id < self.id:
-                        maximal = False
         return maximal
 
     def get_changing_confirmation_from_partner(self):
-        for message in self.mailbox:
-            if (message.iteration == self.iteration-1) and (message.type=="changing") and (message.sender_id == self.partner.id):
-                message.read = True
-                return message.value
+        message = self.mailbox.get_from(self.iteration-1, "changing", self.partner.id)
+        if message is not None:
+            return message.value
         return False
 
     def perform_phase1(self):
-        if random.random() < 0.5 and self.neighbors:
-            self.potential_partner = random.choice(self.neighbors) #second kind
-            self.send_message_to_specific_agent(receiver=self.potential_partner,argument='Empty', msg_type="proposal")
+        if self.draw_uniform() < 0.5 and self.neighbors:
+            self.potential_partner = self.draw_choice(self.neighbors) #second kind
+            self.send_message_to_specific_agent(receiver=self.potential_partner,
+                                                argument=self.compute_unary_costs().copy(), msg_type="proposal")
             self.proposal_sent = True
 
     def perform_phase2(self):
         if self.proposal_sent is False:
             proposals = self.get_last_proposals()
             if len(proposals)>0: # first kind
-                self.partner = self.get_partner_object(random.choice(proposals))
-                self.best_pair_assignment, self.reduction = self.compute_best_pair_assignment(self.partner)
+                proposal = self.draw_choice(proposals)
+                self.partner = self.get_partner_object(proposal)
+                self.best_pair_assignment, self.reduction = self.compute_best_pair_assignment(self.partner,
+                                                                                              proposal.value)
                 self.send_message_to_specific_agent(receiver=self.partner,
                                                     argument=[self.best_pair_assignment, self.reduction],
                                                     msg_type="p2mgm2")
-                self.partner.partner = self
 
     def perform_phase3(self):
-        if self.partner is not None and self.proposal_sent is True: # second kind
+        if self.proposal_sent is True: # second kind
             self.update_reduction_and_best_pair_assignment_from_message()
-        elif self.partner is None: # third kind
+        if self.partner is None: # third kind
             self.best_pair_assignment = self.get_best_value()
             self.reduction = self.current_costs[self.value] - self.current_costs[self.best_pair_assignment]
         self.send_messages(argument=self.reduction, msg_type="reduction")
@@ -263,6 +376,27 @@ class MGM2Agent(MGMAgent):
                 self.value = self.best_pair_assignment
         self.send_messages(argument=self.value, msg_type="value")
 
+    # One phase of the 5-iteration cycle; self.iteration lags one behind, so messages are stamped with the
+    # previous iteration
+    def perform_round(self, iteration):
+        self.round = iteration
+        phase = self.iteration % 5
+        if phase == 0:
+            self.compute_costs_from_last_it()
+            self.clear_read_messages()
+            self.perform_phase1()
+        elif phase == 1:
+            self.perform_phase2()
+        elif phase == 2:
+            self.perform_phase3()
+        elif phase == 3:
+            self.perform_phase4()
+        else:
+            self.perform_phase5()
+        self.iteration = iteration
+        if phase == 4:
+            self.clear_attributes_after_cycle()
+
 
 
 
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from collections import deque
+from agents import Mailbox, Message
+from simulation import Simulation
+
+# ------------------------------------------------- Asyncio Runtime ----------------------------------------------------
+
+# Inbound side of one agent. Senders call append() as with a normal Mailbox; the message is delivered into the
+# agent's queue after the runtime's delay, in FIFO order per sender, and the agent's task files it into the index.
+class AsyncInbox(Mailbox):
+    def __init__(self, runtime):
+        super().__init__()
+        self.runtime = runtime
+        self.queue = asyncio.Queue()
+        self.in_flight = {}  # sender id -> messages not delivered yet
+        self.ticks = {}  # round -> neighbors that finished it
+
+    def append(self, message):
+        self.runtime.count_message(message)
+        delay = self.runtime.message_delay()
+        link = self.in_flight.setdefault(message.sender_id, deque())
+        if delay <= 0 and not link:
+            self.queue.put_nowait(message)
+            return
+        link.append(message)
+        asyncio.get_running_loop().call_later(max(delay, 0), self.deliver, link)
+
+    # Whichever timer fires, the oldest message of the link goes first
+    def deliver(self, link):
+        self.queue.put_nowait(link.popleft())
+
+    def store(self, message):
+        if message.type == "tick":
+            self.ticks[message.iteration] = self.ticks.get(message.iteration, 0) + 1
+        else:
+            Mailbox.append(self, message)
+
+    # Wait until every neighbor has finished `round` (its tick arrives after its other messages of that round)
+    async def wait_for_round(self, round, num_neighbors):
+        while self.ticks.get(round, 0) < num_neighbors:
+            self.store(await self.queue.get())
+        self.ticks.pop(round, None)
+
+
+# Runs every agent of a Simulation as its own asyncio task. Rounds are kept synchronous by a tick each agent sends
+# its neighbors after finishing a round, so the agents execute the same perform_round logic as in Simulation.run,
+# but over delayed, concurrently delivered messages.
+# Everything agents learn from each other goes through their mailboxes and is counted, except what they read off
+# neighbor objects directly: the neighbors' values during MGM2's first cycle (before any value message reaches it)
+# and the proposer's value when an MGM2 agent accepts a proposal. Both are values a neighbor also sends anyway.
+# delay: seconds per message, or a callable returning one; target_cost: cost whose first reach is timed;
+# poll: seconds between global cost samples.
+# seed: draw from per-agent RandomStreams (as Simulation(..., seed=seed)), so a run is reproducible and the same as
+# Simulation's whatever order the tasks interleave in; without one agents draw from the global `random` module in
+# whatever order they happen to run.
+class AsyncRuntime:
+    def __init__(self, DCOP, agent_type, p_dsa=None, delay=0.0, target_cost=None, poll=0.01, seed=None):
+        self.simulation = Simulation(DCOP, agent_type, p_dsa=p_dsa, seed=seed)
+        self.agents = self.simulation.agents
+        self.delay = delay
+        self.target_cost = target_cost
+        self.poll = poll
+        self.messages = 0
+        self.ticks = 0
+        self.rounds_done = 0
+        self.time_to_target = None
+
+    def message_delay(self):
+        return self.delay() if callable(self.delay) else self.delay
+
+    def count_message(self, message):
+        if message.type == "tick":
+            self.ticks += 1
+        else:
+            self.messages += 1
+
+    def send_tick(self, agent, round):
+        for neighbor in agent.neighbors:
+            neighbor.mailbox.append(Message(agent.id, neighbor.id, None, round, "tick"))
+
+    async def run_agent(self, agent, steps):
+        agent.send_messages()
+        self.send_tick(agent, 0)
+        for round in range(1, steps + 1):
+            await agent.mailbox.wait_for_round(round - 1, len(agent.neighbors))
+            agent.perform_round(round)
+            self.send_tick(agent, round)
+            await asyncio.sleep(0)
+        self.rounds_done += steps
+
+    async def monitor(self, start):
+        while True:
+            self.check_target(start)
+            await asyncio.sleep(self.poll)
+
+    def check_target(self, start):
+        if self.target_cost is not None and self.time_to_target is None:
+            if self.simulation.compute_global_cost() <= self.target_cost:
+                self.time_to_target = time.perf_counter() - start
+
+    async def main(self, steps):
+        for agent in self.agents:
+            agent.mailbox = AsyncInbox(self)
+        start = time.perf_counter()
+        monitor = asyncio.create_task(self.monitor(start))
+        await asyncio.gather(*(self.run_agent(agent, steps) for agent in self.agents))
+        monitor.cancel()
+        self.check_target(start)
+        return time.perf_counter() - start
+
+    # Run `steps` rounds and report wall-clock throughput
+    def run(self, steps):
+        wall_time = asyncio.run(self.main(steps))
+        return {
+            "agents": len(self.agents),
+            "rounds": steps,
+            "wall_time": wall_time,
+            "messages": self.messages,
+            "messages_per_second": self.messages / wall_time if wall_time > 0 else float('inf'),
+            "agent_rounds_per_second": self.rounds_done / wall_time if wall_time > 0 else float('inf'),
+            "final_cost": int(self.simulation.compute_global_cost()),
+            "time_to_target": self.time_to_target,
+        }
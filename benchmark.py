@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import itertools
+import tracemalloc
+import numpy as np
+from DCOP import DCOPInstance
+from agents import Mailbox
+from simulation import Simulation
+from sharded import ShardedSimulation
+
+# ---------------------------------------------------- Benchmarks ------------------------------------------------------
+
+ALGORITHMS = [("DSA", 0.7), ("MGM", None), ("MGM2", None)]
+
+
+# Mailbox that counts every message delivered to it into a shared one-element list
+class CountingMailbox(Mailbox):
+    __slots__ = ('counter',)
+
+    def __init__(self, counter):
+        super().__init__()
+        self.counter = counter
+
+    def append(self, message):
+        self.counter[0] += 1
+        Mailbox.append(self, message)
+
+
+def build_simulation(DCOP, algorithm, p_dsa, engine, seed, counter=None):
+    random.seed(seed)
+    simulation = Simulation(DCOP, algorithm, p_dsa, engine=engine)
+    if counter is not None:
+        for agent in simulation.agents:
+            agent.mailbox = CountingMailbox(counter)
+    return simulation
+
+
+# Time instance construction, Simulation setup and Simulation.run for one configuration, best of `repeats`
+# (every repeat uses the same seed, so it does the same work). Memory is measured in one more, traced run so
+# tracemalloc doesn't distort the timings.
+def benchmark_case(num_agents, domain_size, p1, algorithm, p_dsa, engine, steps, seed=1, repeats=3, memory=True):
+    instance_time = setup_time = run_time = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        DCOP = DCOPInstance(num_agents, domain_size, p1, 1, seed=seed)
+        instance_time = min(instance_time, time.perf_counter() - start)
+
+        counter = [0] if engine == 'objects' else None
+        start = time.perf_counter()
+        simulation = build_simulation(DCOP, algorithm, p_dsa, engine, seed, counter)
+        setup_time = min(setup_time, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        simulation.run(steps)
+        run_time = min(run_time, time.perf_counter() - start)
+
+    result = {
+        "algorithm": algorithm,
+        "p_dsa": p_dsa,
+        "engine": engine,
+        "num_agents": num_agents,
+        "domain_size": domain_size,
+        "p1": p1,
+        "steps": steps,
+        "constraints": len(DCOP.edges),
+        "instance_time": instance_time,
+        "setup_time": setup_time,
+        "run_time": run_time,
+        "iterations_per_second": steps / run_time if run_time > 0 else None,
+        # The numpy engine exchanges no messages
+        "messages": counter[0] if counter is not None else None,
+        "messages_per_second": counter[0] / run_time if counter is not None and run_time > 0 else None,
+        "final_cost": int(simulation.global_cost),
+        "peak_memory": None,
+    }
+    if memory:
+        tracemalloc.start()
+        DCOP = DCOPInstance(num_agents, domain_size, p1, 1, seed=seed)
+        build_simulation(DCOP, algorithm, p_dsa, engine, seed).run(steps)
+        result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def case_key(result):
+    return (result["algorithm"], result["p_dsa"], result["engine"], result["num_agents"], result["domain_size"],
+            result["p1"], result["steps"])
+
+
+def run_benchmarks(num_agents, domain_sizes, p1s, engines, steps, algorithms=ALGORITHMS, repeats=3, memory=True,
+                   log=sys.stderr):
+    results = []
+    for n, d, p1, engine, (algorithm, p_dsa) in itertools.product(num_agents, domain_sizes, p1s, engines, algorithms):
+        result = benchmark_case(n, d, p1, algorithm, p_dsa, engine, steps, repeats=repeats, memory=memory)
+        if log:
+            log.write(f"{algorithm:5} {engine:8} n={n:<5} d={d:<3} p1={p1:<5} "
+                      f"{result['iterations_per_second']:10.1f} it/s\n")
+        results.append(result)
+    return results
+
+
+# Agent-rounds per second of ShardedSimulation against its number of workers, on one instance and seed, best of
+# `repeats`. One warm-up round first starts the workers, so only the rounds themselves are timed; `speedup` is
+# relative to the first entry of `workers`. Scaling can only show on a host with at least max(workers) free cores.
+def benchmark_scaling(num_agents, domain_size, p1, algorithm, p_dsa, workers, steps, seed=1, repeats=3,
+                      log=sys.stderr):
+    DCOP = DCOPInstance(num_agents, domain_size, p1, 1, seed=seed)
+    results = []
+    for num_workers in workers:
+        run_time = float('inf')
+        for _ in range(repeats):
+            simulation = ShardedSimulation(DCOP, algorithm, p_dsa, num_workers=num_workers, seed=seed)
+            try:
+                simulation.run(1)
+                start = time.perf_counter()
+                simulation.run(steps + 1)
+                run_time = min(run_time, time.perf_counter() - start)
+            finally:
+                simulation.close()
+        result = {
+            "algorithm": algorithm,
+            "p_dsa": p_dsa,
+            "num_agents": num_agents,
+            "domain_size": domain_size,
+            "p1": p1,
+            "steps": steps,
+            "num_workers": num_workers,
+            "cut_edges": simulation.cut_edges,
+            "run_time": run_time,
+            "agent_rounds_per_second": num_agents * steps / run_time if run_time > 0 else None,
+            "speedup": results[0]["run_time"] / run_time if results and run_time > 0 else 1.0,
+        }
+        if log:
+            log.write(f"{algorithm:5} sharded  n={num_agents:<6} workers={num_workers:<3} "
+                      f"{result['agent_rounds_per_second']:12.0f} agent-rounds/s  x{result['speedup']:.2f}\n")
+        results.append(result)
+    return results
+
+
+# Cases of `results` slower (iterations/sec) or larger (peak memory) than the baseline by more than `tolerance`
+def compare_to_baseline(results, baseline, tolerance=0.2):
+    reference = {case_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = reference.get(case_key(result))
+        if old is None:
+            continue
+        for metric, worse in [("iterations_per_second", lambda new, old: new < old * (1 - tolerance)),
+                              ("peak_memory", lambda new, old: new > old * (1 + tolerance))]:
+            if result[metric] is not None and old[metric] is not None and worse(result[metric], old[metric]):
+                regressions.append({"case": dict(zip(["algorithm", "p_dsa", "engine", "num_agents", "domain_size",
+                                                      "p1", "steps"], case_key(result))),
+                                    "metric": metric, "baseline": old[metric], "current": result[metric]})
+    return regressions
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Time instance construction, setup and runs of DSA, MGM and MGM2")
+    parser.add_argument("--agents", type=int, nargs="+", default=[30, 100])
+    parser.add_argument("--domains", type=int, nargs="+", default=[5, 10])
+    parser.add_argument("--p1", type=float, nargs="+", default=[0.2, 0.5])
+    parser.add_argument("--engines", nargs="+", default=["objects", "numpy"], choices=["objects", "numpy"])
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=3, help="keep the fastest of this many runs")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced run for peak memory")
+    parser.add_argument("--output", help="write the results as JSON here (default: stdout)")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown / memory growth")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        help="also time ShardedSimulation (DSA) with each of these worker counts")
+    parser.add_argument("--scaling-agents", type=int, default=100000, help="instance size of the scaling benchmark")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "results": run_benchmarks(args.agents, args.domains, args.p1, args.engines, args.steps,
+                                  repeats=args.repeats, memory=not args.no_memory),
+    }
+    if args.workers:
+        report["scaling"] = benchmark_scaling(args.scaling_agents, args.domains[0], 5 / args.scaling_agents, "DSA",
+                                              0.7, args.workers, args.steps, repeats=args.repeats)
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare_to_baseline(report["results"], json.load(f), args.tolerance)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    if report.get("regressions"):
+        for regression in report["regressions"]:
+            sys.stderr.write(f"Regression in {regression['metric']}: {regression['case']} "
+                             f"{regression['baseline']} -> {regression['current']}\n")
+        sys.exit(1)
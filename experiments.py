@@ -0,0 +1,369 @@
+import os
+import sys
+import json
+import zlib
+import random
+import hashlib
+import importlib
+import itertools
+import numpy as np
+from statistics import NormalDist
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from DCOP import DCOPInstance, GENERATOR_VERSION, atomic_write
+from simulation import BatchedSimulation
+
+# ------------------------------------------------ Experiment Executor -------------------------------------------------
+
+# One run: the instance is rebuilt in the worker from its generation parameters and seed.
+# Only every record_every-th iteration of the history is sent back; patience enables early stopping (Simulation).
+Job = namedtuple('Job', ['num_agents', 'domain_size', 'p1', 'p2', 'seed', 'algorithm', 'p_dsa', 'steps', 'record_every',
+                         'patience'], defaults=(1, None))
+JobResult = namedtuple('JobResult', ['job', 'history', 'final_cost', 'converged_at'])
+
+
+# Seed of the agents' random streams, derived only from the job itself so results don't depend on scheduling
+def job_seed(job):
+    return zlib.crc32(f"{job.seed}:{job.algorithm}:{job.p_dsa}".encode())
+
+
+def instance_key(job):
+    return job.num_agents, job.domain_size, job.p1, job.p2, job.seed
+
+
+# Generate the job's instance, or load it from an InstanceStore when one is given
+def build_instance(job, store=None):
+    if store is not None:
+        return store.get(*instance_key(job))
+    return DCOPInstance(job.num_agents, job.domain_size, job.p1, job.p2, seed=job.seed)
+
+
+# Instances a worker has attached from shared memory, with the blocks that back them
+_attached = {}
+
+
+def attach_instance(handle):
+    if handle not in _attached:
+        _attached[handle] = DCOPInstance.from_shared_memory(handle)
+    return _attached[handle][0]
+
+
+# Checkpoint file of a chunk, named after its jobs
+def chunk_checkpoint(checkpoint_dir, jobs):
+    return os.path.join(checkpoint_dir, hashlib.sha1(repr(list(jobs)).encode()).hexdigest()[:16] + ".npz")
+
+
+# Run a chunk of jobs sharing algorithm, p_dsa, steps and problem size as one BatchedSimulation.
+# Each instance has its own random streams, so batching never changes a job's result.
+# handles: SharedInstance per job when the parent placed the instances in shared memory
+# store: InstanceStore to load instances from instead of generating them
+# checkpoint_dir: checkpoint the chunk there every checkpoint_every iterations and resume from an existing checkpoint
+def run_jobs(jobs, handles=None, store=None, checkpoint_dir=None, checkpoint_every=None):
+    first = jobs[0]
+    if handles is not None:
+        instances = [attach_instance(handle) for handle in handles]
+    else:
+        instances = [build_instance(job, store) for job in jobs]
+    path = chunk_checkpoint(checkpoint_dir, jobs) if checkpoint_dir is not None else None
+    if path is not None and os.path.exists(path):
+        Sim = BatchedSimulation.from_checkpoint(path, instances, checkpoint_path=path, checkpoint_every=checkpoint_every)
+    else:
+        Sim = BatchedSimulation(instances, first.algorithm, p_dsa=first.p_dsa, seeds=[job_seed(job) for job in jobs],
+                                record_every=first.record_every, patience=first.patience, checkpoint_path=path,
+                                checkpoint_every=checkpoint_every, streams=True)
+    Sim.run(first.steps)
+    return [JobResult(job, Sim.history[b], Sim.global_cost[b], Sim.converged_at[b]) for b, job in enumerate(jobs)]
+
+
+def print_progress(done, total, result):
+    job = result.job
+    sys.stderr.write(f"\r[{done}/{total}] {job.algorithm} p1={job.p1} p2={job.p2} seed={job.seed}   ")
+    if done == total:
+        sys.stderr.write("\n")
+    sys.stderr.flush()
+
+
+# Fans jobs out over a process pool and yields JobResults as they complete.
+# workers=1 runs everything in this process; chunk_size bounds how many jobs share one batched run.
+# share_instances: build each instance once here and hand workers shared-memory handles instead of having every
+# worker regenerate it. store: InstanceStore the instances are loaded from (and saved to on first use).
+# checkpoint_dir: every chunk is checkpointed there every checkpoint_every iterations and when it finishes, so running
+# the same jobs again after a crash resumes the unfinished chunks and skips the finished ones.
+# cache: ResultCache; jobs found in it are yielded first without running, the others are stored as they complete
+class ExperimentExecutor:
+    def __init__(self, workers=None, chunk_size=10, progress=print_progress, share_instances=True, store=None,
+                 checkpoint_dir=None, checkpoint_every=100, cache=None):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.share_instances = share_instances
+        self.store = store
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_every = checkpoint_every
+        self.cache = cache
+        if checkpoint_dir is not None:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def make_chunks(self, jobs):
+        groups = {}
+        for job in jobs:
+            key = (job.algorithm, job.p_dsa, job.steps, job.record_every, job.patience, job.num_agents, job.domain_size)
+            groups.setdefault(key, []).append(job)
+        chunks = []
+        for group in groups.values():
+            for start in range(0, len(group), self.chunk_size):
+                chunks.append(group[start:start + self.chunk_size])
+        return chunks
+
+    def run(self, jobs):
+        jobs = list(jobs)
+        cached = []
+        if self.cache is not None:
+            found = [self.cache.get(job) for job in jobs]
+            cached = [result for result in found if result is not None]
+            jobs = [job for job, result in zip(jobs, found) if result is None]
+        yield from self.stream(itertools.chain([cached], self.remember(self.compute(jobs))), len(cached) + len(jobs))
+
+    # Batches of results of jobs that had to run, stored in the cache on the way
+    def remember(self, batches):
+        for results in batches:
+            if self.cache is not None:
+                for result in results:
+                    self.cache.put(result)
+            yield results
+
+    # Runs the jobs, yielding the results of each chunk as one batch
+    def compute(self, jobs):
+        if not jobs:
+            return
+        chunks = self.make_chunks(jobs)
+        if self.workers == 1:
+            yield from (run_jobs(chunk, None, self.store, self.checkpoint_dir, self.checkpoint_every)
+                        for chunk in chunks)
+            return
+        handles, blocks = {}, []
+        if self.share_instances:
+            for job in jobs:
+                key = instance_key(job)
+                if key not in handles:
+                    handles[key], instance_blocks = build_instance(job, self.store).to_shared_memory()
+                    blocks += instance_blocks
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = []
+                for chunk in chunks:
+                    chunk_handles = [handles[instance_key(job)] for job in chunk] if handles else None
+                    futures.append(pool.submit(run_jobs, chunk, chunk_handles, self.store, self.checkpoint_dir,
+                                               self.checkpoint_every))
+                yield from (future.result() for future in as_completed(futures))
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+    def stream(self, batches, total):
+        done = 0
+        for results in batches:
+            for result in results:
+                done += 1
+                if self.progress:
+                    self.progress(done, total, result)
+                yield result
+
+
+# --------------------------------------------------- Result Cache -----------------------------------------------------
+
+# Modules whose code decides a run's result, from the instance generator to job_seed and run_jobs here; editing any
+# of them invalidates every cached result
+CODE_MODULES = ('DCOP', 'streams', 'agents', 'vectorized', 'maxsum', 'simulation', 'experiments')
+
+
+# Hash of the source of CODE_MODULES
+def code_version():
+    digest = hashlib.sha1()
+    for name in CODE_MODULES:
+        with open(importlib.import_module(name).__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+# On-disk cache of JobResults, one .npz per run, keyed by the instance (generation parameters, seed and generator
+# version), algorithm, p_dsa, steps, record_every, patience and the code version (default: code_version()).
+# Least recently used results are evicted once there are more than max_entries or they take more than max_bytes
+# (file access times are kept as mtimes, so the order carries over between sessions).
+# Only one process should write to a cache at a time; ExperimentExecutor uses it from the parent only.
+class ResultCache:
+    def __init__(self, root, max_entries=None, max_bytes=2**30, version=None):
+        self.root = root
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version = version if version is not None else code_version()
+        os.makedirs(root, exist_ok=True)
+        files = [entry for entry in os.scandir(root) if entry.name.endswith(".npz")]
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        self.entries = OrderedDict((entry.name, entry.stat().st_size) for entry in files)  # Oldest use first
+        self.size = sum(self.entries.values())
+
+    def key(self, job):
+        params = json.dumps([int(job.num_agents), int(job.domain_size), float(job.p1), float(job.p2), int(job.seed),
+                             GENERATOR_VERSION, job.algorithm, job.p_dsa, int(job.steps), int(job.record_every),
+                             job.patience, self.version])
+        return hashlib.sha1(params.encode()).hexdigest()[:20] + ".npz"
+
+    def __contains__(self, job):
+        return self.key(job) in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Stored JobResult of `job`, or None
+    def get(self, job):
+        name = self.key(job)
+        if name not in self.entries:
+            return None
+        path = os.path.join(self.root, name)
+        with np.load(path) as data:
+            result = JobResult(job, data['history'], data['final_cost'][()], data['converged_at'][()])
+        os.utime(path)
+        self.entries.move_to_end(name)
+        return result
+
+    # Written with atomic_write
+    def put(self, result):
+        name = self.key(result.job)
+        path = os.path.join(self.root, name)
+
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                np.savez(f, history=np.asarray(result.history, dtype=np.int64), final_cost=np.int64(result.final_cost),
+                         converged_at=np.int64(-1 if result.converged_at is None else result.converged_at))
+        atomic_write(path, write)
+        size = os.path.getsize(path)
+        self.size += size - self.entries.pop(name, 0)
+        self.entries[name] = size
+        self.evict()
+
+    def evict(self):
+        while self.entries and ((self.max_entries is not None and len(self.entries) > self.max_entries)
+                                or (self.max_bytes is not None and self.size > self.max_bytes)):
+            name, size = self.entries.popitem(last=False)
+            os.remove(os.path.join(self.root, name))
+            self.size -= size
+
+    def clear(self):
+        while self.entries:
+            name, _ = self.entries.popitem()
+            os.remove(os.path.join(self.root, name))
+        self.size = 0
+
+
+# -------------------------------------------------- Adaptive Sweeps ---------------------------------------------------
+
+# Two-sided Student t quantile for `confidence` with `df` degrees of freedom, from the normal quantile
+# (Cornish-Fisher expansion; within 0.2% of the exact value from df = 5 on)
+def t_quantile(confidence, df):
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    return (z + (z ** 3 + z) / (4 * df) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3))
+
+
+# Mean and confidence interval half-width of a sample
+def confidence_interval(samples, confidence=0.95):
+    samples = np.asarray(samples, dtype=float)
+    if len(samples) < 2:
+        return float(samples.mean()) if len(samples) else float('nan'), float('inf')
+    half_width = t_quantile(confidence, len(samples) - 1) * samples.std(ddof=1) / np.sqrt(len(samples))
+    return float(samples.mean()), float(half_width)
+
+
+# Runs every algorithm on every sweep point, adding instances in batches only where needed: a point gets more
+# instances until the confidence interval of each algorithm's mean final cost is at most target_width wide or at most
+# relative_width times the mean, or max_runs is reached. With both, target_width is a floor for the relative target,
+# which a mean near 0 could otherwise never meet.
+# All algorithms of a point run on the same instances with the same seeds (common random numbers), so the
+# paired difference() between two algorithms is much tighter than the two intervals suggest.
+# points: (num_agents, domain_size, p1, p2) tuples, kept as Python ints and floats so the seeds drawn for a point do
+# not depend on how numpy prints its scalars; algorithms: (algorithm, p_dsa) pairs
+# patience: per algorithm, as in Job; seed: makes the instance seeds of every point reproducible
+class AdaptiveSweep:
+    def __init__(self, points, algorithms, steps, target_width=None, relative_width=None, batch_size=10, min_runs=10,
+                 max_runs=200, confidence=0.95, patience=None, executor=None, seed=0, on_result=None):
+        if target_width is None and relative_width is None:
+            raise ValueError("Give target_width or relative_width")
+        self.points = [(int(num_agents), int(domain_size), float(p1), float(p2))
+                       for num_agents, domain_size, p1, p2 in points]
+        self.algorithms = list(algorithms)
+        self.steps = steps
+        self.target_width = target_width
+        self.relative_width = relative_width
+        self.batch_size = batch_size
+        self.min_runs = min_runs
+        self.max_runs = max_runs
+        self.confidence = confidence
+        self.patience = patience or {}
+        self.executor = executor or ExperimentExecutor()
+        self.on_result = on_result
+        self.seed_sources = {point: random.Random(f"{seed}:{point}") for point in self.points}
+        self.seeds = {point: [] for point in self.points}
+        self.final_costs = {(point, algorithm): {} for point in self.points for algorithm in self.algorithms}
+
+    def samples(self, point, algorithm):
+        costs = self.final_costs[(point, algorithm)]
+        return [costs[seed] for seed in self.seeds[point] if seed in costs]
+
+    def interval(self, point, algorithm):
+        return confidence_interval(self.samples(point, algorithm), self.confidence)
+
+    def is_precise(self, point):
+        for algorithm in self.algorithms:
+            mean, half_width = self.interval(point, algorithm)
+            target = max(self.target_width or 0, (self.relative_width or 0) * abs(mean))
+            if 2 * half_width > target:
+                return False
+        return True
+
+    def unfinished(self):
+        return [point for point in self.points if len(self.seeds[point]) < self.min_runs
+                or (len(self.seeds[point]) < self.max_runs and not self.is_precise(point))]
+
+    def new_jobs(self, point):
+        runs = len(self.seeds[point])
+        count = min(max(self.batch_size, self.min_runs - runs), self.max_runs - runs)
+        new_seeds = []
+        while len(new_seeds) < count:
+            seed = self.seed_sources[point].randint(1, 100000)
+            if seed not in self.seeds[point] and seed not in new_seeds:
+                new_seeds.append(seed)
+        self.seeds[point] += new_seeds
+        num_agents, domain_size, p1, p2 = point
+        return [Job(num_agents, domain_size, p1, p2, seed, algorithm, p_dsa, self.steps, self.steps,
+                    self.patience.get(algorithm)) for algorithm, p_dsa in self.algorithms for seed in new_seeds]
+
+    def run(self):
+        pending = self.unfinished()
+        while pending:
+            jobs = [job for point in pending for job in self.new_jobs(point)]
+            for result in self.executor.run(jobs):
+                job = result.job
+                point = (job.num_agents, job.domain_size, job.p1, job.p2)
+                self.final_costs[(point, (job.algorithm, job.p_dsa))][job.seed] = int(result.final_cost)
+                if self.on_result is not None:
+                    self.on_result(result)
+            pending = self.unfinished()
+        return self.summary()
+
+    # Runs, mean final cost and interval half-width per (point, algorithm)
+    def summary(self):
+        summary = {}
+        for (point, algorithm) in self.final_costs:
+            mean, half_width = self.interval(point, algorithm)
+            summary[(point, algorithm)] = {"runs": len(self.samples(point, algorithm)), "mean": mean,
+                                           "half_width": half_width}
+        return summary
+
+    # Mean and interval half-width of the paired difference first - second over the instances of a point
+    def difference(self, point, first, second):
+        first_costs, second_costs = self.final_costs[(point, first)], self.final_costs[(point, second)]
+        paired = [first_costs[seed] - second_costs[seed] for seed in self.seeds[point]
+                  if seed in first_costs and seed in second_costs]
+        return confidence_interval(paired, self.confidence)
@@ -0,0 +1,153 @@
+import json
+import time
+from agents import Mailbox
+
+# -------------------------------------------------- Instrumentation ---------------------------------------------------
+
+# Mailbox that also counts every message it receives, by type, into the profiler's current iteration
+class InstrumentedMailbox(Mailbox):
+    __slots__ = ('profiler',)
+
+    def __init__(self, profiler):
+        super().__init__()
+        self.profiler = profiler
+
+    def append(self, message):
+        counts = self.profiler.messages
+        counts[message.type] = counts.get(message.type, 0) + 1
+        Mailbox.append(self, message)
+
+
+# Opt-in profiler for a Simulation: Simulation(..., profiler=Profiler()).
+# attach() replaces the methods named in PROFILED_METHODS of the simulation, its agents (or its VectorizedEngine)
+# with timed wrappers on those instances only, and gives the agents counting mailboxes, so a simulation without a
+# profiler runs exactly the code it runs without this module.
+# Per iteration (one row per round, round 0 being the initial value messages) it records the wall time spent in
+# every profiled method (inclusive of the profiled methods it calls), messages by type, the number of messages held
+# in all mailboxes at the end of the round and how many agents changed value.
+# spans=True additionally keeps every single call for the trace (large: one event per agent and phase).
+class Profiler:
+    def __init__(self, spans=False):
+        self.spans = [] if spans else None
+        self.rows = []
+        self.totals = {}  # method -> [calls, seconds]
+        self.simulation = None
+        self.origin = None
+        self.round = None
+
+    def attach(self, simulation):
+        self.simulation = simulation
+        self.origin = time.perf_counter()
+        self.wrap(simulation, simulation.PROFILED_METHODS, "simulation")
+        if simulation.vectorized is not None:
+            self.wrap(simulation.vectorized, simulation.vectorized.PROFILED_METHODS, "engine")
+        for agent in simulation.agents:
+            self.wrap(agent, agent.PROFILED_METHODS, agent.id)
+            agent.mailbox = InstrumentedMailbox(self)
+        self.wrap_run(simulation)
+        self.start_round(0)
+
+    def wrap(self, target, methods, owner):
+        for name in methods:
+            setattr(target, name, self.timed(getattr(target, name), name, owner))
+
+    def timed(self, method, name, owner):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                end = time.perf_counter()
+                self.times[name] = self.times.get(name, 0.0) + end - start
+                total = self.totals.setdefault(name, [0, 0.0])
+                total[0] += 1
+                total[1] += end - start
+                if self.spans is not None:
+                    self.spans.append((name, owner, start - self.origin, end - start, self.round))
+        return wrapper
+
+    # Rounds are closed when the simulation records the global cost for the next iteration, and at the end of run()
+    def wrap_run(self, simulation):
+        record, run = simulation.record_global_cost, simulation.run
+
+        def record_global_cost():
+            self.end_round()
+            self.start_round(simulation.iteration)
+            return record()
+
+        def run_and_close(steps):
+            if self.round is None:
+                self.start_round(simulation.iteration)
+            try:
+                return run(steps)
+            finally:
+                self.end_round()
+        simulation.record_global_cost = record_global_cost
+        simulation.run = run_and_close
+
+    def start_round(self, round):
+        self.round = round
+        self.round_start = time.perf_counter()
+        self.times = {}
+        self.messages = {}
+        self.values = self.current_values()
+
+    def end_round(self):
+        if self.round is None:
+            return
+        values = self.current_values()
+        agents = self.simulation.agents
+        self.rows.append({
+            "iteration": self.round,
+            "start": self.round_start - self.origin,
+            "wall_time": time.perf_counter() - self.round_start,
+            "phase_times": self.times,
+            "messages": self.messages,
+            "mailbox_size": sum(len(agent.mailbox) for agent in agents),
+            "max_mailbox_size": max((len(agent.mailbox) for agent in agents), default=0),
+            "value_changes": sum(1 for old, new in zip(self.values, values) if old != new),
+        })
+        self.round = None
+
+    def current_values(self):
+        if self.simulation.vectorized is not None:
+            return self.simulation.vectorized.values.tolist()
+        return [agent.value for agent in self.simulation.agents]
+
+    # Calls and total seconds per profiled method, and messages per type, over the whole run
+    def summary(self):
+        messages = {}
+        for row in self.rows:
+            for msg_type, count in row["messages"].items():
+                messages[msg_type] = messages.get(msg_type, 0) + count
+        return {
+            "phases": {name: {"calls": calls, "seconds": seconds} for name, (calls, seconds) in self.totals.items()},
+            "messages": messages,
+            "value_changes": sum(row["value_changes"] for row in self.rows),
+            "iterations": len(self.rows),
+        }
+
+    # Chrome trace event format (chrome://tracing, Perfetto): one span per iteration, counters for the per-iteration
+    # statistics and, with spans=True, one span per profiled call on the thread of its agent
+    def trace_events(self):
+        events = []
+        for row in self.rows:
+            events.append({"name": f"iteration {row['iteration']}", "ph": "X", "pid": 0, "tid": "simulation",
+                           "ts": row["start"] * 1e6, "dur": row["wall_time"] * 1e6})
+            ts = row["start"] * 1e6
+            events.append({"name": "messages", "ph": "C", "pid": 0, "ts": ts, "args": row["messages"]})
+            events.append({"name": "phase time (ms)", "ph": "C", "pid": 0, "ts": ts,
+                           "args": {name: seconds * 1e3 for name, seconds in row["phase_times"].items()}})
+            events.append({"name": "mailboxes", "ph": "C", "pid": 0, "ts": ts,
+                           "args": {"total": row["mailbox_size"], "max": row["max_mailbox_size"]}})
+            events.append({"name": "value changes", "ph": "C", "pid": 0, "ts": ts,
+                           "args": {"agents": row["value_changes"]}})
+        for name, owner, start, duration, round in self.spans or []:
+            events.append({"name": name, "ph": "X", "pid": 0, "tid": owner, "ts": start * 1e6, "dur": duration * 1e6,
+                           "args": {"iteration": round}})
+        return events
+
+    def export_trace(self, path):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f)
+
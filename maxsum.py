@@ -0,0 +1,96 @@
+import numpy as np
+from vectorized import VectorizedEngine
+
+
+# ------------------------------------------------- Max-Sum Engine -----------------------------------------------------
+
+# Synchronous Max-Sum (min-sum over costs) with one factor per constraint, every message of a round computed at once.
+# Directed CSR entry k (agent src[k], constraint edge_ids[k]) carries two messages of length domain_size:
+#   messages[k]: variable src[k] -> its factor, the sum of what src[k]'s other factors told it, damped and shifted
+#                to a minimum of 0
+#   factor -> variable src[k]: min over the other agent's values of the constraint cost plus the other agent's
+#                message, i.e. factor_messages()[k]
+# After every round each agent takes the value minimizing its belief, the sum of its incoming factor messages and of a
+# unary preference below PREFERENCE_SCALE per value, keeping its value on ties. Without the preferences every agent
+# of an instance with p2 < 1 (a zero cell in every row of every constraint) would see all-zero messages and never
+# leave its initial value. On the loopy, dense instances here the messages rarely converge and these assignments
+# keep oscillating. `values` (what the global cost and history report) is the current assignment, as for the local
+# searches; with anytime=True it is instead the best assignment of each instance seen so far, while `assignment` keeps
+# following the beliefs (not comparable with DSA/MGM histories, which report their current cost).
+# Nothing is drawn at random past the initial values and the preferences, which come from `rngs`/`streams` (as in
+# VectorizedEngine; RandomStreams.fixed_draws).
+# damping: weight of the previous variable message in the new one, 0 for plain Max-Sum
+class MaxSumEngine(VectorizedEngine):
+    ALGORITHMS = ('MaxSum',)
+    PROFILED_METHODS = ('factor_messages', 'variable_messages', 'set_values', 'compute_global_cost')
+    STATE = VectorizedEngine.STATE + ('messages', 'assignment', 'preferences')
+    PREFERENCE_SCALE = 1e-3  # Far below the smallest difference of two costs (1)
+
+    def __init__(self, DCOP, damping=0.5, anytime=False, rngs=None, streams=None):
+        if not 0 <= damping < 1:
+            raise ValueError("damping must be in [0, 1)")
+        self.damping = damping
+        self.anytime = anytime
+        super().__init__(DCOP, 'MaxSum', rngs=rngs, streams=streams)
+        if streams is not None:
+            uniforms = streams.fixed_draws(self.domain_size)
+        else:
+            uniforms = np.array([[rng.random() for _ in range(self.domain_size)] for rng in self.rngs
+                                 for _ in range(self.block_size)])
+        self.preferences = self.PREFERENCE_SCALE * uniforms
+        # Entries of each constraint's row and column agent, so factor messages are computed per constraint straight
+        # from cost_tensor (views of its compact costs, no per-entry copy)
+        self.row_entry = np.empty(len(self.edge_ends), dtype=np.int64)
+        self.row_entry[self.edge_ids[~self.transposed]] = np.flatnonzero(~self.transposed)
+        self.column_entry = np.empty(len(self.edge_ends), dtype=np.int64)
+        self.column_entry[self.edge_ids[self.transposed]] = np.flatnonzero(self.transposed)
+
+    # Messages restart from zero, e.g. when a run forks into Max-Sum from another algorithm's values
+    def clear_cycle_state(self):
+        super().clear_cycle_state()
+        self.messages = np.zeros((len(self.src), self.domain_size))
+        self.assignment = self.values.copy()
+
+    # One minimum per value of the other agent: a loop of domain_size elementwise minimums is several times
+    # faster than reducing a (constraints, domain_size, domain_size) array over its short last axis
+    def factor_messages(self):
+        from_row, from_column = self.messages[self.row_entry], self.messages[self.column_entry]
+        to_row = self.cost_tensor[:, :, 0] + from_column[:, :1]
+        to_column = self.cost_tensor[:, 0, :] + from_row[:, :1]
+        for b in range(1, self.domain_size):
+            np.minimum(to_row, self.cost_tensor[:, :, b] + from_column[:, b:b + 1], out=to_row)
+            np.minimum(to_column, self.cost_tensor[:, b, :] + from_row[:, b:b + 1], out=to_column)
+        factor = np.empty_like(self.messages)
+        factor[self.row_entry] = to_row
+        factor[self.column_entry] = to_column
+        return factor
+
+    # Damped variable messages and every agent's belief (its preferences plus its incoming factor messages) from
+    # factor messages
+    def variable_messages(self, factor):
+        beliefs = np.bincount(self._row_index, weights=factor.ravel(), minlength=self.num_agents * self.domain_size)
+        beliefs = beliefs.reshape(self.num_agents, self.domain_size) + self.preferences
+        messages = beliefs[self.src] - factor
+        messages -= messages.min(axis=1)[:, None]
+        self.messages = self.damping * self.messages + (1 - self.damping) * messages
+        return beliefs
+
+    # Global cost of each stacked instance under `values`
+    def assignment_costs(self, values):
+        e = np.arange(len(self.edge_ends))
+        costs = self.cost_tensor[e, values[self.edge_ends[:, 0]], values[self.edge_ends[:, 1]]]
+        return np.bincount(self._edge_instance, weights=costs, minlength=self.num_instances).astype(np.int64)
+
+    def step(self, iteration):
+        self.iteration = iteration
+        beliefs = self.variable_messages(self.factor_messages())
+        best = beliefs.argmin(axis=1)
+        rows = np.arange(self.num_agents)
+        tied = beliefs[rows, self.assignment] == beliefs[rows, best]
+        self.assignment = np.where(tied, self.assignment, best)
+        if not self.anytime:
+            self.set_values(self.assignment)
+            return
+        improved = self.assignment_costs(self.assignment) < self.instance_costs
+        if improved.any():
+            self.set_values(np.where(np.repeat(improved, self.block_size), self.assignment, self.values))
@@ -1,4 +1,5 @@
 from agents import DSAAgent, MGMAgent, MGM2Agent
+from DCOP import sample_edges, sample_coloring_tensor
 import numpy as np
 import random
 import copy
@@ -37,15 +38,16 @@ class ProblemInstance:
         for i in range(num_agents):
             self.initial_values.append(random.choice(domain))
 
-        # Construct random graph edges with probability k and assign cost matrices
-        for i in range(num_agents):
-            for j in range(i + 1, num_agents):
-                if random.random() < k:
-                    self.neighbors_map[i].append(j)
-                    self.neighbors_map[j].append(i)
-                    matrix = create_constraint_matrix(domain, coloring=coloring)
-                    self.cost_matrices[i][j] = matrix
-                    self.cost_matrices[j][i] = matrix
+        # Construct random graph edges with probability k and assign cost matrices (symmetric, so both agents share
+        # one), all sampled at once from a Generator seeded with the same seed
+        rng = np.random.default_rng(seed)
+        edges = sample_edges(num_agents, k, rng)
+        matrices = sample_coloring_tensor(len(edges), len(domain), rng, coloring=coloring)
+        for (i, j), matrix in zip(edges.tolist(), matrices.tolist()):
+            self.neighbors_map[i].append(j)
+            self.neighbors_map[j].append(i)
+            self.cost_matrices[i][j] = matrix
+            self.cost_matrices[j][i] = matrix
 
 
 def build_agents_from_problem(problem, domain, algorithm, p=None):
@@ -0,0 +1,131 @@
+import argparse
+import numpy as np
+import matplotlib.pyplot as plt
+from recording import load_results
+
+# ----------------------------------------------------- Plotting -------------------------------------------------------
+
+# Plot global cost histories for different algorithms
+def plot_costs(all_histories,indices, k, show=True):
+    plt.figure()
+    all_values = []
+
+    # Plot DSA histories (record every iteration)
+    dsa_histories = all_histories.get("DSA", {})
+    for p, history in dsa_histories.items():
+        plt.plot(indices, history, label=f"DSA p={p}", linewidth=0.6)
+        all_values.extend(history)
+
+    # Plot MGM (step every 2 iterations)
+    mgm_history = all_histories.get("MGM", {}).get(None)
+    if mgm_history:
+        plt.step(indices, mgm_history, where="post", label="MGM", linewidth=0.6)
+        all_values.extend(mgm_history)
+
+    # Plot MGM2 (step every 5 iterations)
+    mgm2_history = all_histories.get("MGM2", {}).get(None)
+    if mgm2_history:
+        plt.step(indices, mgm2_history, where="post", label="MGM2", linewidth=0.6)
+        all_values.extend(mgm2_history)
+
+    # Plot Max-Sum (record every iteration)
+    maxsum_history = all_histories.get("MaxSum", {}).get(None)
+    if maxsum_history:
+        plt.plot(indices, maxsum_history, label="Max-Sum", linewidth=0.6)
+        all_values.extend(maxsum_history)
+
+    plt.xlabel("Iteration")
+    plt.ylabel("Global Cost")
+    plt.title(f"DSA vs MGM | p1={k}")
+    plt.legend()
+    plt.grid(True)
+    plt.tight_layout()
+    filename = f"DSA_vs_MGM_p1{k}.png"
+    plt.savefig(filename, dpi=300)
+    if show:
+        plt.show()
+
+
+# Mean final cost per algorithm against p2, for one p1
+def plot_all_costs(all_costs_dict, p_1, show=True):
+    plt.figure()  # יצירת חלון חדש לכל p1
+    x_vals = sorted(all_costs_dict.keys())
+
+    if not x_vals:
+        print("No data to plot")
+        return
+
+    first_key = x_vals[0]
+    algs = list(all_costs_dict[first_key].keys())
+
+    for alg in algs:
+        y_vals = [all_costs_dict[x][alg] for x in x_vals]
+        plt.plot(x_vals, y_vals, marker='o', label=alg)
+
+    plt.xlabel('p2')
+    plt.ylabel('Total Cost')
+    plt.title(f'Costs vs p2 (p1={p_1})')
+    plt.legend()
+    plt.grid(True)
+    plt.savefig(f"costs_vs_p2_p1{p_1}.png", dpi=300)
+    if show:
+        plt.show()
+
+
+# ------------------------------------------------- Results to Plots ---------------------------------------------------
+
+# (algorithm, p_dsa) pairs of the selected rows, p_dsa None where the column is NaN
+def algorithm_keys(results, rows):
+    keys = set(zip(results['algorithm'][rows].tolist(), results['p_dsa'][rows].tolist()))
+    return sorted(((algorithm, None if np.isnan(p_dsa) else p_dsa) for algorithm, p_dsa in keys), key=str)
+
+
+def select(results, rows, algorithm, p_dsa):
+    p_dsa_column = results['p_dsa'][rows]
+    same_p_dsa = np.isnan(p_dsa_column) if p_dsa is None else p_dsa_column == p_dsa
+    return rows[(results['algorithm'][rows] == algorithm) & same_p_dsa]
+
+
+# Mean recorded history over the instances of every algorithm at one p1, in the layout plot_costs takes
+def mean_histories(results, p1):
+    rows = np.flatnonzero((results['p1'] == p1) & (results['iteration'] < results['steps']))
+    all_histories, indices = {}, []
+    for algorithm, p_dsa in algorithm_keys(results, rows):
+        selected = select(results, rows, algorithm, p_dsa)
+        iterations, position = np.unique(results['iteration'][selected], return_inverse=True)
+        means = np.bincount(position, weights=results['cost'][selected]) / np.bincount(position)
+        all_histories.setdefault(algorithm, {})[p_dsa] = means.tolist()
+        indices = iterations.tolist()
+    return all_histories, indices
+
+
+# Mean final cost over the instances per p2 and algorithm at one p1, in the layout plot_all_costs takes
+def mean_final_costs(results, p1):
+    rows = np.flatnonzero((results['p1'] == p1) & (results['iteration'] == results['steps']))
+    all_costs = {}
+    for p2 in np.unique(results['p2'][rows]).tolist():
+        at_p2 = rows[results['p2'][rows] == p2]
+        for algorithm, p_dsa in algorithm_keys(results, at_p2):
+            costs = results['cost'][select(results, at_p2, algorithm, p_dsa)]
+            all_costs.setdefault(p2, {})[algorithm] = float(costs.mean())
+    return all_costs
+
+
+# Plots of a results file: final cost against p2 when it sweeps p2, the mean cost history otherwise
+def plot_results(path, show=False):
+    results = load_results(path)
+    for p1 in np.unique(results['p1']).tolist():
+        if len(np.unique(results['p2'][results['p1'] == p1])) > 1:
+            plot_all_costs(mean_final_costs(results, p1), p1, show=show)
+        else:
+            all_histories, indices = mean_histories(results, p1)
+            plot_costs(all_histories, indices, p1, show=show)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Plot results files written by the simulation runners")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--show", action="store_true", help="also open the plots in a window")
+    args = parser.parse_args()
+    for path in args.paths:
+        plot_results(path, show=args.show)
@@ -0,0 +1,130 @@
+import os
+import shutil
+import zipfile
+import tempfile
+import numpy as np
+from DCOP import atomic_write
+
+
+# ------------------------------------------------ History Recording ---------------------------------------------------
+
+# Global cost of a run at iterations 1, 1 + every, 1 + 2 * every, ... in a preallocated array
+# (the same points the runner used to sample with range(0, len(history), space)).
+# instances: record a batch of runs at once, values then has one row per instance (BatchedSimulation)
+class HistoryRecorder:
+    def __init__(self, steps, every=1, instances=None, dtype=float):
+        self.every = every
+        self.shape = () if instances is None else (instances,)
+        self.values = np.zeros(self.shape + (-(-steps // every),), dtype=dtype)
+        self.count = 0
+
+    def record(self, iteration, cost):
+        if (iteration - 1) % self.every == 0 and self.count < self.values.shape[-1]:
+            self.values[..., self.count] = cost
+            self.count += 1
+
+    # Room for the samples of a run up to `steps` (a resumed or continued run can go on past the first one)
+    def extend(self, steps):
+        samples = -(-steps // self.every)
+        if samples > self.values.shape[-1]:
+            values = np.zeros(self.shape + (samples,), dtype=self.values.dtype)
+            values[..., :self.count] = self.values[..., :self.count]
+            self.values = values
+
+    # The frozen cost for every sample still to come (the run stopped early)
+    def fill(self, cost):
+        self.values[..., self.count:] = np.asarray(cost)[..., None]
+        self.count = self.values.shape[-1]
+
+    # Carry on from the samples of an earlier run, e.g. out of a checkpoint
+    def load(self, samples):
+        samples = np.asarray(samples)
+        self.extend(samples.shape[-1] * self.every)
+        self.values[..., :samples.shape[-1]] = samples
+        self.count = samples.shape[-1]
+
+    # Iterations (0-based, like history indices) of the recorded samples
+    def indices(self):
+        return list(range(0, self.count * self.every, self.every))
+
+    # Recorded samples
+    def finish(self):
+        return self.values[..., :self.count]
+
+
+# ------------------------------------------------------ Results -------------------------------------------------------
+
+# Columns of a results file: one row per (instance, algorithm, parameters, iteration). Every run contributes its
+# recorded history (iterations 0, record_every, ...) and its final cost at iteration == steps.
+# p_dsa is NaN for algorithms without it, converged_at -1 for runs that did not converge.
+RESULT_COLUMNS = ('num_agents', 'domain_size', 'p1', 'p2', 'seed', 'algorithm', 'p_dsa', 'steps', 'iteration', 'cost',
+                  'converged_at')
+RESULT_DTYPES = {'num_agents': np.int64, 'domain_size': np.int64, 'p1': np.float64, 'p2': np.float64,
+                 'seed': np.int64, 'algorithm': np.dtype('U8'), 'p_dsa': np.float64, 'steps': np.int64,
+                 'iteration': np.int64, 'cost': np.int64, 'converged_at': np.int64}
+
+
+# Collects JobResults as they stream in and writes them as one columnar .npz file. Rows are buffered until there are
+# flush_rows of them, then appended to one spill file per column in a temporary directory, so memory stays bounded
+# however many runs are added; save() copies the spill files into the .npz entry by entry.
+class ResultsWriter:
+    def __init__(self, flush_rows=2**16):
+        self.flush_rows = flush_rows
+        self.spill = tempfile.TemporaryDirectory(prefix="results")
+        self.columns = {name: [] for name in RESULT_COLUMNS}
+        self.buffered = 0
+        self.rows = 0
+
+    def add(self, result):
+        job = result.job
+        if len(job.algorithm) > RESULT_DTYPES['algorithm'].itemsize // 4:
+            raise ValueError(f"Algorithm name {job.algorithm!r} is too long for the results file")
+        iterations = np.append(np.arange(len(result.history)) * job.record_every, job.steps)
+        costs = np.append(np.asarray(result.history, dtype=np.int64), result.final_cost)
+        converged_at = -1 if result.converged_at is None else result.converged_at
+        p_dsa = np.nan if job.p_dsa is None else job.p_dsa
+        for name, value in [('num_agents', job.num_agents), ('domain_size', job.domain_size), ('p1', job.p1),
+                            ('p2', job.p2), ('seed', job.seed), ('algorithm', job.algorithm), ('p_dsa', p_dsa),
+                            ('steps', job.steps), ('converged_at', converged_at)]:
+            self.columns[name].append(np.full(len(iterations), value, dtype=RESULT_DTYPES[name]))
+        self.columns['iteration'].append(iterations)
+        self.columns['cost'].append(costs)
+        self.buffered += len(iterations)
+        if self.buffered >= self.flush_rows:
+            self.flush()
+
+    # Append the buffered rows to the spill files
+    def flush(self):
+        for name, parts in self.columns.items():
+            if parts:
+                with open(os.path.join(self.spill.name, name), "ab") as f:
+                    np.concatenate(parts).astype(RESULT_DTYPES[name]).tofile(f)
+        self.columns = {name: [] for name in RESULT_COLUMNS}
+        self.rows += self.buffered
+        self.buffered = 0
+
+    # Written with atomic_write; each column is streamed from its spill file into an .npy entry
+    def save(self, path):
+        self.flush()
+
+        def write(tmp_path):
+            with zipfile.ZipFile(tmp_path, "w", allowZip64=True) as archive:
+                for name in RESULT_COLUMNS:
+                    header = {'descr': np.lib.format.dtype_to_descr(np.dtype(RESULT_DTYPES[name])),
+                              'fortran_order': False, 'shape': (self.rows,)}
+                    with archive.open(name + ".npy", "w", force_zip64=True) as entry:
+                        np.lib.format.write_array_header_2_0(entry, header)
+                        spill_path = os.path.join(self.spill.name, name)
+                        if os.path.exists(spill_path):
+                            with open(spill_path, "rb") as f:
+                                shutil.copyfileobj(f, entry, 2**20)
+        atomic_write(path, write)
+
+    # Remove the spill files; the writer cannot be saved after this
+    def close(self):
+        self.spill.cleanup()
+
+
+# Columns of a results file; each one is only read from disk when it is first accessed
+def load_results(path):
+    return np.load(path)
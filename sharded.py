@@ -0,0 +1,300 @@
+import random
+import multiprocessing
+import numpy as np
+from collections import deque
+from DCOP import DCOPInstance, share_array, attach_array, check_integer_costs
+from streams import RandomStreams, ACCEPT, PICK
+
+# ------------------------------------------------ Graph Partitioning --------------------------------------------------
+
+# Split the agents into num_parts balanced parts with few cut constraints: consecutive chunks of a BFS order,
+# then a few passes moving boundary agents to the part most of their neighbors are in (within max_imbalance).
+def partition_graph(DCOP, num_parts, refine_passes=4, max_imbalance=0.05):
+    n = DCOP.num_agents
+    offsets, neighbors = DCOP.csr_offsets, DCOP.csr_neighbors
+    seen = np.zeros(n, dtype=bool)
+    order = []
+    for root in np.argsort(np.diff(offsets), kind='stable').tolist():
+        if seen[root]:
+            continue
+        seen[root] = True
+        queue = deque([root])
+        while queue:
+            u = queue.popleft()
+            order.append(u)
+            for v in neighbors[offsets[u]:offsets[u + 1]].tolist():
+                if not seen[v]:
+                    seen[v] = True
+                    queue.append(v)
+    parts = np.empty(n, dtype=np.int64)
+    parts[order] = np.arange(n) * num_parts // max(n, 1)
+
+    capacity = int(np.ceil(n / num_parts * (1 + max_imbalance)))
+    src = np.repeat(np.arange(n), np.diff(offsets))
+    for _ in range(refine_passes):
+        links = np.bincount(src * num_parts + parts[neighbors], minlength=n * num_parts).reshape(n, num_parts)
+        best = links.argmax(axis=1)
+        gain = links[np.arange(n), best] - links[np.arange(n), parts]
+        candidates = np.flatnonzero(gain > 0)
+        if len(candidates) == 0:
+            break
+        sizes = np.bincount(parts, minlength=num_parts)
+        moved = np.zeros(n, dtype=bool)
+        for u in candidates[np.argsort(-gain[candidates], kind='stable')].tolist():
+            target = best[u]
+            adjacent = neighbors[offsets[u]:offsets[u + 1]]
+            # Moving two adjacent agents at once could undo the gain
+            if sizes[target] >= capacity or moved[adjacent].any():
+                continue
+            sizes[parts[u]] -= 1
+            sizes[target] += 1
+            parts[u] = target
+            moved[u] = True
+    return parts
+
+
+def count_cut_edges(DCOP, parts):
+    return int((parts[DCOP.edges[:, 0]] != parts[DCOP.edges[:, 1]]).sum())
+
+
+# ------------------------------------------------- Partition Worker ---------------------------------------------------
+
+# One partition: computes its agents' local costs from the shared values (its own and its boundary neighbors'),
+# publishes how many alternative values each agent may draw from, and applies the coordinator's draws.
+# Every round is three barrier-separated steps: (1) workers publish partial global cost and counts,
+# (2) the coordinator records the cost and draws, (3) workers write their agents' new values.
+# With a seed the worker draws from its agents' rows of the RandomStreams itself, and step (2) goes away.
+# The worker lives as long as its ShardedSimulation: it runs rounds start + 1 .. steps for every (start, steps) it
+# receives on `commands`, ends each run with its final partial cost and one more barrier, and exits on None.
+def run_partition(handle, state_specs, part, own, agent_type, commands, barrier, p_dsa=None, seed=None):
+    blocks = []
+    DCOP, instance_blocks = DCOPInstance.from_shared_memory(handle)
+    blocks += instance_blocks
+    state = {}
+    for name, spec in state_specs.items():
+        shm, state[name] = attach_array(spec)
+        blocks.append(shm)
+    values, counts, picks, reduction, partial = (state['values'], state['counts'], state['picks'],
+                                                 state['reduction'], state['partial'])
+
+    d = DCOP.domain_size
+    degree = np.diff(DCOP.csr_offsets)[own]
+    entries = np.repeat(DCOP.csr_offsets[own] - np.cumsum(degree) + degree, degree) + np.arange(degree.sum())
+    src_local = np.repeat(np.arange(len(own)), degree)
+    dst = DCOP.csr_neighbors[entries]
+    edge_ids, transposed = DCOP.csr_edges[entries], DCOP.csr_transposed[entries]
+    row_index = (src_local[:, None] * d + np.arange(d)).ravel()
+    owned_mask = np.zeros(DCOP.num_agents, dtype=bool)
+    owned_mask[own] = True
+    owned_edges = np.flatnonzero(owned_mask[DCOP.edges[:, 0]])
+    rows_of_own = np.arange(len(own))
+
+    # Cost rows of entries k given the other agent's values
+    def edge_rows(k, other):
+        rows = DCOP.cost_tensor[edge_ids[k], :, other].astype(np.int64)
+        column_side = transposed[k]
+        rows[column_side] = DCOP.cost_tensor[edge_ids[k][column_side], other[column_side], :]
+        return rows
+
+    # Local costs of the own agents, computed once and then patched from the neighbors whose value changed since
+    # (as VectorizedEngine.set_values does)
+    seen, costs_now = None, None
+
+    def local_costs():
+        nonlocal seen, costs_now
+        other = values[dst]
+        if seen is None:
+            costs_now = np.bincount(row_index, weights=edge_rows(slice(None), other).ravel(), minlength=len(own) * d)
+            costs_now = costs_now.reshape(len(own), d).astype(np.int64)
+        else:
+            k = np.flatnonzero(other != seen)
+            if len(k):
+                np.add.at(costs_now, src_local[k], edge_rows(k, other[k]) - edge_rows(k, seen[k]))
+        seen = other
+        return costs_now
+
+    def publish_partial_cost():
+        e = owned_edges
+        partial[part] = DCOP.cost_tensor[e, values[DCOP.edges[e, 0]], values[DCOP.edges[e, 1]]].sum()
+
+    def alternatives(costs):
+        alt = costs == costs.min(axis=1)[:, None]
+        alt[rows_of_own, values[own]] = False
+        return alt
+
+    def picked_values(alt):
+        mine = picks[own]
+        new = values[own].copy()
+        movers = np.flatnonzero(mine >= 0)
+        if len(movers):
+            new[movers] = np.argmax(np.cumsum(alt[movers], axis=1) > mine[movers][:, None], axis=1)
+        return new
+
+    # Only this partition's rows are drawn, so a worker's random numbers cost O(len(own)) per round
+    streams = RandomStreams([seed], agent_type, DCOP.num_agents, agents=own) if seed is not None else None
+
+    # Same picks as VectorizedEngine.get_best_values with streams, for this partition's agents
+    def stream_picks(iteration, counts_own):
+        draws = streams.draws(iteration)
+        move = counts_own > 0
+        if agent_type == 'DSA' and p_dsa != 1:
+            move &= draws[:, ACCEPT] < p_dsa
+        mine = np.full(len(own), -1, dtype=np.int64)
+        mine[move] = RandomStreams.pick(draws[move, PICK], counts_own[move])
+        picks[own] = mine
+
+    costs = alt = None
+    while True:
+        command = commands.recv()
+        if command is None:
+            break
+        start, steps = command
+        for iteration in range(start + 1, steps + 1):
+            publish_partial_cost()
+            odd = agent_type == 'DSA' or iteration % 2 == 1
+            if odd:
+                costs = local_costs()
+                alt = alternatives(costs)
+                counts[own] = alt.sum(axis=1)
+            else:
+                if costs is None:
+                    costs = local_costs()
+                    alt = alternatives(costs)
+                # MGM decide_to_change: no neighbor with a larger reduction, ties to the lower id
+                mine, theirs = reduction[own][src_local], reduction[dst]
+                beaten = (theirs > mine) | ((theirs == mine) & (dst < own[src_local]))
+                maximal = np.bincount(src_local[beaten], minlength=len(own)) == 0
+                counts[own] = np.where(maximal, alt.sum(axis=1), 0)
+            if streams is not None:
+                stream_picks(iteration, counts[own])
+                barrier.wait()
+            else:
+                barrier.wait()
+                barrier.wait()  # Coordinator draws
+            new = picked_values(alt)
+            if agent_type == 'MGM' and odd:
+                reduction[own] = costs[rows_of_own, values[own]] - costs[rows_of_own, new]
+            else:
+                values[own] = new
+            barrier.wait()
+        publish_partial_cost()
+        barrier.wait()
+    del values, counts, picks, reduction, partial, state, DCOP
+    for shm in blocks:
+        shm.close()
+
+
+# ------------------------------------------------ Sharded Simulation --------------------------------------------------
+
+# DSA / MGM with the agents split over worker processes by partition_graph. Values, reductions and draw requests
+# live in shared memory; each worker only reads the entries of its own agents and their boundary neighbors.
+# Random draws are made by this (coordinating) process from the global `random` module in agent order, so under
+# the same seed the history matches Simulation and VectorizedEngine exactly; that serial draw loop is the part
+# that does not scale with the number of workers. With a seed every worker draws from its own agents' RandomStreams
+# instead, matching Simulation(..., seed=seed), and rounds need one barrier less.
+class ShardedSimulation:
+    def __init__(self, DCOP, agent_type, p_dsa=None, num_workers=2, parts=None, seed=None):
+        if agent_type not in ('DSA', 'MGM'):
+            raise ValueError("Sharded simulation supports DSA and MGM")
+        check_integer_costs(DCOP)
+        self.DCOP = DCOP
+        self.agent_type = agent_type
+        self.p_dsa = p_dsa
+        self.num_workers = num_workers
+        self.parts = partition_graph(DCOP, num_workers) if parts is None else np.asarray(parts)
+        self.cut_edges = count_cut_edges(DCOP, self.parts)
+        self.seed = seed
+        self.iteration = 0
+        self.history = []
+
+        n = DCOP.num_agents
+        if seed is not None:
+            initial = RandomStreams([seed], agent_type, n).initial_values(DCOP.domain_size)
+        else:
+            initial = np.array([random.choice(range(DCOP.domain_size)) for _ in range(n)], dtype=np.int64)
+        self.handle, self.blocks = DCOP.to_shared_memory()
+        self.state, self.state_specs = {}, {}
+        for name, array in [('values', initial), ('counts', np.zeros(n, dtype=np.int64)),
+                            ('picks', np.full(n, -1, dtype=np.int64)), ('reduction', np.zeros(n)),
+                            ('partial', np.zeros(num_workers, dtype=np.int64))]:
+            shm, spec = share_array(array)
+            self.blocks.append(shm)
+            self.state[name] = np.ndarray(array.shape, array.dtype, buffer=shm.buf)
+            self.state_specs[name] = spec
+        self.global_cost = None
+        self.workers, self.barrier = [], None
+
+    @property
+    def values(self):
+        return self.state['values'].copy()
+
+    # Same draws, in the same order, as VectorizedEngine.get_best_values
+    def draw(self):
+        counts, picks = self.state['counts'], self.state['picks']
+        picks[:] = -1
+        if self.agent_type == 'DSA' and self.p_dsa != 1:
+            for i, count in enumerate(counts.tolist()):
+                if random.random() < self.p_dsa and count:
+                    picks[i] = random.choice(range(count))
+        else:
+            for i in np.flatnonzero(counts).tolist():
+                picks[i] = random.choice(range(counts[i]))
+
+    # Workers are started on the first run and then kept until close(), so later runs pay no process start-up
+    def start_workers(self, timeout):
+        self.barrier = multiprocessing.Barrier(self.num_workers + 1, timeout=timeout)
+        for w in range(self.num_workers):
+            own = np.flatnonzero(self.parts == w)
+            commands, worker_end = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=run_partition, daemon=True, args=(
+                self.handle, self.state_specs, w, own, self.agent_type, worker_end, self.barrier, self.p_dsa,
+                self.seed))
+            worker.start()
+            worker_end.close()
+            self.workers.append((worker, commands))
+
+    def run(self, steps, timeout=600):
+        if steps <= self.iteration:
+            return
+        if not self.workers:
+            self.start_workers(timeout)
+        barrier = self.barrier
+        for _, commands in self.workers:
+            commands.send((self.iteration, steps))
+        try:
+            while self.iteration < steps:
+                self.iteration += 1
+                barrier.wait()
+                self.global_cost = int(self.state['partial'].sum())
+                self.history.append(self.global_cost)
+                if self.seed is None:
+                    self.draw()
+                    barrier.wait()
+                barrier.wait()
+            barrier.wait()  # Workers have published the final partial costs
+        except Exception:
+            barrier.abort()
+            self.stop_workers()
+            raise
+
+    def stop_workers(self):
+        for worker, commands in self.workers:
+            try:
+                commands.send(None)
+            except OSError:
+                pass
+            commands.close()
+        for worker, _ in self.workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()
+        self.workers = []
+
+    def close(self):
+        self.stop_workers()
+        for array in list(self.state):
+            self.state[array] = None
+        for shm in self.blocks:
+            shm.close()
+            shm.unlink()
+        self.blocks = []
@@ -1,19 +1,155 @@
-from agents import DSAAgent, MGMAgent, MGM2Agent
-import copy
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('TkAgg')
+from agents import DSAAgent, MGMAgent, MGM2Agent, Message
+from vectorized import VectorizedEngine
+from maxsum import MaxSumEngine
+from DCOP import DCOPInstance, atomic_write, check_integer_costs
+from streams import RandomStreams
+from recording import HistoryRecorder
+import json
+import random
+import numpy as np
 
 # ------------------------------------------------- Simulation Class ---------------------------------------------------
 
+# Iterations in one full cycle of each algorithm
+CYCLE_LENGTH = {'DSA': 1, 'MGM': 2, 'MGM2': 5, 'MaxSum': 1}
+
+# Algorithms whose patience watches the global cost instead of the values: DSA agents on a tie keep changing value
+PLATEAU_RULE = ('DSA',)
+
+
+# Array engine for agent_type: Max-Sum has its own, the local searches share VectorizedEngine
+def make_engine(DCOP, agent_type, p_dsa=None, damping=0.5, rngs=None, streams=None, anytime=False):
+    if agent_type == 'MaxSum':
+        return MaxSumEngine(DCOP, damping, anytime, rngs=rngs, streams=streams)
+    return VectorizedEngine(DCOP, agent_type, p_dsa, rngs=rngs, streams=streams)
+
+# ---------------------------------------------------- Checkpoints -----------------------------------------------------
+
+# A checkpoint is one .npz file: the state arrays plus a JSON `meta` entry with the run's parameters.
+# It is written next to `path` and renamed into place, so a crash never leaves a truncated checkpoint.
+def write_checkpoint(path, meta, arrays):
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+    atomic_write(path, write)
+
+
+def read_checkpoint(path):
+    with np.load(path) as data:
+        arrays = {name: data[name] for name in data.files}
+    return json.loads(str(arrays.pop('meta'))), arrays
+
+
+# Mersenne Twister states of `random`-like sources as arrays: (sources, 625) words and gauss_next (NaN for None)
+def rng_state(rngs):
+    states = [rng.getstate() for rng in rngs]
+    words = np.array([state[1] for state in states], dtype=np.uint32)
+    gauss = np.array([np.nan if state[2] is None else state[2] for state in states])
+    return {'rng_words': words, 'rng_gauss': gauss}
+
+
+def set_rng_state(rngs, state):
+    for rng, words, gauss in zip(rngs, state['rng_words'], state['rng_gauss']):
+        rng.setstate((3, tuple(int(w) for w in words), None if np.isnan(gauss) else float(gauss)))
+
+
+def instance_params(DCOP):
+    return [DCOP.num_agents, DCOP.domain_size, DCOP.p1, DCOP.p2, DCOP.seed]
+
+
+# p_dsa of a resumed run: the caller's, else the checkpoint's as long as the algorithm stays the same
+def resumed_p_dsa(meta, agent_type, p_dsa):
+    if p_dsa is None and agent_type == meta['agent_type']:
+        p_dsa = meta['p_dsa']
+    if agent_type == 'DSA' and p_dsa is None:
+        raise ValueError("Resuming or forking into DSA needs a p_dsa")
+    return p_dsa
+
+
+# Only state at a cycle boundary of both algorithms carries over to a different algorithm or engine
+def check_fork(iteration, saved_type, agent_type):
+    if iteration % CYCLE_LENGTH[saved_type] or iteration % CYCLE_LENGTH[agent_type]:
+        raise ValueError(f"Iteration {iteration} is not between cycles of {saved_type} and {agent_type}")
+
 class Simulation:
-    def __init__(self, DCOP,agent_type,p_dsa=None):
+    # Methods a Profiler (instrumentation.py) times when attached
+    PROFILED_METHODS = ('update_global_cost', 'compute_global_cost')
+
+    # engine: 'objects' runs one Agent object per variable, 'numpy' runs whole rounds on arrays (VectorizedEngine)
+    # check_every: recompute the global cost from scratch every k iterations and fail if the tracked value drifted
+    # recorder: HistoryRecorder that receives the global costs instead of the history list
+    # patience: stop once no agent changed value for this many full cycles (DSA: the global cost did not change,
+    # PLATEAU_RULE); the rest of the history gets the final cost and converged_at the iteration of the last change.
+    # MGM decides without drawing who moves, so one cycle without a move already means it never moves again; for the
+    # other algorithms a quiet stretch is no proof and a later move can still lower the cost.
+    # profiler: instrumentation.Profiler to attach; without one nothing is wrapped or counted
+    # checkpoint_path / checkpoint_every: save_checkpoint to this file every k iterations (object engine: k must be
+    # a multiple of the cycle length, its agents are only checkpointed between cycles)
+    # seed: draw from per-agent RandomStreams of this seed instead of the global random module; both engines then
+    # give the same run for the same seed, whatever else uses `random`
+    # damping / anytime: Max-Sum's message damping and whether to report its best assignment so far instead of the
+    # current one (MaxSumEngine); Max-Sum only runs on the numpy engine
+    # active_set: DSA and MGM on the object engine; each round runs just the agents that can act (run_active), same run
+    # as without
+    def __init__(self, DCOP,agent_type,p_dsa=None, engine='objects', check_every=None, recorder=None, patience=None,
+                 profiler=None, checkpoint_path=None, checkpoint_every=None, seed=None, damping=0.5, active_set=False,
+                 anytime=False):
+        if agent_type == 'MaxSum' and engine != 'numpy':
+            raise ValueError("MaxSum runs only with engine='numpy'")
+        if active_set and engine != 'objects':
+            raise ValueError("active_set schedules agent objects; use engine='objects'")
+        if active_set and agent_type == 'MGM2':
+            raise ValueError("active_set supports DSA and MGM; MGM2 pairs across the whole graph every cycle")
+        # Skipped DSA agents would not draw their global random number, shifting everyone else's draws
+        if active_set and agent_type == 'DSA' and p_dsa != 1 and seed is None:
+            raise ValueError("active_set with DSA and p_dsa < 1 needs a seed (per-agent random streams)")
         self.DCOP = DCOP
         self.agent_type = agent_type
-        self.agents = self.build_agents_from_problem(DCOP,p_dsa)
+        self.p_dsa = p_dsa
+        self.damping = damping
+        self.anytime = anytime
+        self.engine = engine
+        self.seed = seed
+        self.streams = RandomStreams([seed], agent_type, DCOP.num_agents) if seed is not None else None
+        if engine == 'objects' and checkpoint_every and checkpoint_every % CYCLE_LENGTH[agent_type]:
+            raise ValueError("checkpoint_every must be a multiple of the cycle length with the object engine")
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        if engine == 'objects':
+            check_integer_costs(DCOP)
+            self.agents = self.build_agents_from_problem(DCOP,p_dsa)
+            self.vectorized = None
+            if self.streams is not None:
+                for agent, value in zip(self.agents, self.streams.initial_values(DCOP.domain_size).tolist()):
+                    agent.streams = self.streams
+                    agent.value = value
+        elif engine == 'numpy':
+            self.agents = []
+            self.vectorized = make_engine(DCOP, agent_type, p_dsa, damping, streams=self.streams, anytime=anytime)
+        else:
+            raise ValueError("Unknown engine type")
         self.iteration = 0
         self.history = []
-
+        self.check_every = check_every
+        self.recorder = recorder
+        self.patience = patience
+        self.converged_at = None
+        self.last_change = 0
+        self.moves = 0  # Value changes so far
+        # Global cost is computed once here and then updated from the agents that changed value
+        self.tracked_values = [agent.value for agent in self.agents]
+        self.active_set = active_set
+        self.active = set(range(len(self.agents)))  # Agents run_active runs in the next cycle
+        self.moved = None  # Agents that may have moved since the last record_global_cost (None: any)
+        for agent in self.agents:
+            agent.quiet = self.active_set
+        if self.vectorized is not None:
+            self.global_cost = self.vectorized.instance_costs.sum()
+        else:
+            self.global_cost = self.compute_global_cost()
+        self.profiler = profiler
+        if profiler is not None:
+            profiler.attach(self)
 
     def build_agents_from_problem(self, DCOP, p_dsa):
         agents = []
@@ -29,69 +165,242 @@ class Simulation:
 
             agents.append(agent)
 
-        # Attach neighbors and their cost matrices
+        # Attach neighbors and their cost matrices (read-only views shared with the instance)
         for i, agent in enumerate(agents):
             for j in DCOP.neighbors_map[i]:
                 agent.neighbors.append(agents[j])
-                agent.cost_matrices[agents[j].id] = copy.deepcopy(DCOP.cost_matrices[i][j])
+                agent.cost_matrices[agents[j].id] = DCOP.cost_matrices[i][j]
         return agents
 
     # Run the simulation
     def run(self,steps):
+        if self.vectorized is not None:
+            while self.iteration < steps:
+                self.iteration += 1
+                self.record_global_cost()
+                if self.has_converged():
+                    self.finish_early(steps)
+                    return
+                self.vectorized.step(self.iteration)
+                self.save_periodic_checkpoint()
+            return
+
         # Generate new messages
         if self.agents[0].__class__ in [DSAAgent, MGMAgent, MGM2Agent]:
             for agent in self.agents:
                 agent.send_messages()
 
+        if self.active_set:
+            self.run_active(steps)
+            return
+
         while self.iteration < steps:
             self.iteration += 1
 
-            self.global_cost = self.compute_global_cost()
+            self.record_global_cost()
+            if self.has_converged():
+                self.finish_early(steps)
+                return
+
+            for agent in self.agents:
+                agent.perform_round(self.iteration)
+            self.save_periodic_checkpoint()
+
+    # Worklist schedule for DSA and MGM: an agent is run only when a neighbor moved since it last computed its costs,
+    # when it moved itself, or when it still had other best values (DSA: it may move at any round; MGM: it is the
+    # only kind that draws or moves). Everyone else would compute the same costs, find nothing to change and draw
+    # nothing, so skipping them leaves the run exactly as with every agent running, at a cost per round that
+    # follows the agents around a change instead of the graph. Quiet agents only send values and reductions that
+    # changed and neighbors keep the last ones. MGM2 pairs at random across the whole graph every cycle (every agent
+    # draws, and the order proposals arrive in matters), so it has no active set and __init__ rejects it.
+    def run_active(self, steps):
+        while self.iteration < steps:
+            self.iteration += 1
+
+            self.record_global_cost()
+            if self.has_converged():
+                self.finish_early(steps)
+                return
+
+            if self.agent_type == 'MGM' and self.iteration % 2 == 0:
+                # Deciding round: only agents with another best value can move
+                ran = [agent for agent in self.agents_in(self.active) if agent.has_alternatives]
+            else:
+                ran = self.agents_in(self.active)
+            for agent in ran:
+                agent.perform_round(self.iteration)
+
+            if self.agent_type == 'DSA' or self.iteration % 2 == 0:
+                movers = [agent for agent in ran if agent.value != self.tracked_values[agent.id]]
+                self.active = {agent.id for agent in ran if agent.has_alternatives}
+                for agent in movers:
+                    self.active.add(agent.id)
+                    self.active.update(neighbor.id for neighbor in agent.neighbors)
+                self.moved = movers
+            self.save_periodic_checkpoint()
+
+    # Agent objects of a set of ids, in id order (the order every agent runs in)
+    def agents_in(self, ids):
+        return [self.agents[i] for i in sorted(ids)]
+
+    def record_global_cost(self):
+        previous_cost, previous_moves = self.global_cost, self.moves
+        if self.vectorized is not None:
+            self.global_cost = self.vectorized.instance_costs.sum()
+            self.moves = int(self.vectorized.moves.sum())
+        else:
+            self.global_cost = self.update_global_cost(self.moved)
+            self.moved = [] if self.active_set else None
+        if self.agent_type in PLATEAU_RULE:
+            changed = self.global_cost != previous_cost
+        else:
+            changed = self.moves != previous_moves
+        if changed:
+            self.last_change = self.iteration - 1
+        if self.check_every and self.iteration % self.check_every == 0:
+            expected = self.compute_global_cost()
+            if expected != self.global_cost:
+                raise RuntimeError(f"Tracked global cost {self.global_cost} drifted from {expected} "
+                                   f"at iteration {self.iteration}")
+        if self.recorder is not None:
+            self.recorder.record(self.iteration, self.global_cost)
+        else:
             self.history.append(self.global_cost)
 
-            if self.agents[0].__class__ in [DSAAgent]:
-                for agent in self.agents:
-                    agent.iteration = self.iteration
-                    agent.compute_costs_from_last_it()
-                    agent.perform_phase1()
-                    agent.clear_read_messages()
-                    agent.send_messages()
-
-            elif self.agents[0].__class__ in [MGMAgent]:
-                if self.iteration % 2 == 1:
-                    for agent in self.agents:
-                        agent.iteration = self.iteration
-                        agent.compute_costs_from_last_it()
-                        agent.perform_phase1()
-                        agent.clear_read_messages()
-                        agent.send_messages()
-                else:
-                    for agent in self.agents:
-                        agent.iteration = self.iteration
-                        agent.perform_phase2()
-
-            elif self.agents[0].__class__ in [MGM2Agent]:
-                    for agent in self.agents:
-                        if agent.iteration % 5 == 0:
-                            agent.compute_costs_from_last_it()
-                            agent.clear_read_messages()
-                            agent.perform_phase1()
-                            agent.iteration = self.iteration
-                        elif agent.iteration % 5 == 1:
-                            agent.perform_phase2()
-                            agent.iteration = self.iteration
-                        elif agent.iteration % 5 == 2:
-                            agent.perform_phase3()
-                            agent.iteration = self.iteration
-                        elif agent.iteration % 5 == 3:
-                            agent.perform_phase4()
-                            agent.iteration = self.iteration
-                        elif agent.iteration % 5 == 4:
-                            agent.perform_phase5()
-                            agent.iteration = self.iteration
-                            agent.clear_attributes_after_cycle()
+    # Apply the cost change on the edges of every agent that moved since the last call, O(degree) per mover.
+    # agents: the only ones that may have moved (default: look at all of them)
+    def update_global_cost(self, agents=None):
+        total = self.global_cost
+        for agent in self.agents if agents is None else agents:
+            old_value = self.tracked_values[agent.id]
+            if agent.value == old_value:
+                continue
+            matrices = agent.cost_matrices
+            for neighbor in agent.neighbors:
+                neighbor_value = self.tracked_values[neighbor.id]
+                matrix = matrices[neighbor.id]
+                # int(): costs are stored compact (uint8), their difference must not wrap
+                total += int(matrix[agent.value][neighbor_value]) - int(matrix[old_value][neighbor_value])
+            self.tracked_values[agent.id] = agent.value
+            self.moves += 1
+        return total
+
+    def has_converged(self):
+        if not self.patience:
+            return False
+        return self.iteration - 1 - self.last_change >= self.patience * CYCLE_LENGTH[self.agent_type]
+
+    # Stop at the current iteration and record the frozen cost for the remaining ones
+    def finish_early(self, steps):
+        self.converged_at = self.last_change
+        for iteration in range(self.iteration + 1, steps + 1):
+            if self.recorder is not None:
+                self.recorder.record(iteration, self.global_cost)
+            else:
+                self.history.append(self.global_cost)
+        self.iteration = steps
+
+    def save_periodic_checkpoint(self):
+        if self.checkpoint_path and self.checkpoint_every and self.iteration % self.checkpoint_every == 0:
+            self.save_checkpoint(self.checkpoint_path)
+
+    # Values, engine state, random state and history after the current iteration. Agent objects are checkpointed
+    # only between cycles, when all they hold is the last round's value messages.
+    def save_checkpoint(self, path):
+        if self.vectorized is None and self.iteration % CYCLE_LENGTH[self.agent_type]:
+            raise ValueError("The object engine can only be checkpointed between cycles")
+        if self.recorder is not None:
+            history = self.recorder.finish()
+        else:
+            history = self.history
+        arrays = {'history': np.array(history, dtype=np.int64)}
+        if self.streams is None:
+            arrays.update(rng_state([random]))
+        if self.vectorized is not None:
+            engine_state = dict(self.vectorized.get_state())
+            arrays['values'] = engine_state.pop('values')
+            arrays.update(('engine_' + name, array) for name, array in engine_state.items())
+        else:
+            arrays['values'] = np.array([agent.value for agent in self.agents], dtype=np.int64)
+        meta = {'kind': 'Simulation', 'agent_type': self.agent_type, 'p_dsa': self.p_dsa, 'engine': self.engine,
+                'iteration': self.iteration, 'global_cost': int(self.global_cost), 'last_change': self.last_change,
+                'converged_at': self.converged_at, 'patience': self.patience, 'check_every': self.check_every,
+                'seed': self.seed, 'damping': self.damping, 'anytime': self.anytime,
+                'instance': instance_params(self.DCOP)}
+        write_checkpoint(path, meta, arrays)
+
+    # Continue a run from a checkpoint. DCOP defaults to regenerating the instance from its saved parameters.
+    # Passing another agent_type (with its p_dsa) or engine forks the run: the values, random state and history
+    # carry over and the new algorithm starts a fresh cycle, so this needs a checkpoint between cycles of both.
+    @classmethod
+    def from_checkpoint(cls, path, DCOP=None, agent_type=None, p_dsa=None, engine=None, **kwargs):
+        meta, arrays = read_checkpoint(path)
+        if meta.get('kind') != 'Simulation':
+            raise ValueError(f"{path} is not a Simulation checkpoint")
+        if DCOP is None:
+            DCOP = DCOPInstance(*meta['instance'])
+        agent_type, engine = agent_type or meta['agent_type'], engine or meta['engine']
+        forked = agent_type != meta['agent_type'] or engine != meta['engine']
+        p_dsa = resumed_p_dsa(meta, agent_type, p_dsa)
+        kwargs.setdefault('patience', meta['patience'])
+        kwargs.setdefault('check_every', meta['check_every'])
+        kwargs.setdefault('seed', meta['seed'])
+        kwargs.setdefault('damping', meta.get('damping', 0.5))
+        kwargs.setdefault('anytime', meta.get('anytime', False))
+        simulation = cls(DCOP, agent_type, p_dsa, engine=engine, **kwargs)
+        if forked:
+            check_fork(meta['iteration'], meta['agent_type'], simulation.agent_type)
+        simulation.restore(meta, arrays, forked)
+        return simulation
+
+    def restore(self, meta, arrays, forked=False):
+        self.iteration = meta['iteration']
+        self.last_change = meta['last_change']
+        self.converged_at = meta['converged_at']
+        history = arrays['history']
+        if self.recorder is not None:
+            self.recorder.load(history)
+        else:
+            self.history = list(history)
+        values = arrays['values']
+        if self.vectorized is not None:
+            if forked:
+                self.vectorized.set_values(values)
+                self.vectorized.clear_cycle_state()
+            else:
+                engine_state = {name[len('engine_'):]: array for name, array in arrays.items()
+                                if name.startswith('engine_')}
+                self.vectorized.set_state(dict(engine_state, values=values))
+            self.vectorized.iteration = self.iteration
+            self.global_cost = self.vectorized.instance_costs.sum()
+            self.moves = int(self.vectorized.moves.sum())
+        else:
+            self.restore_agents(values)
+            self.global_cost = self.compute_global_cost()
+            self.tracked_values = [agent.value for agent in self.agents]
+            self.active = set(range(len(self.agents)))
+            self.moved = None
+        if 'rng_words' in arrays:
+            set_rng_state([random], arrays)
+
+    # Agents between cycles: the values, what they know of their neighbors and the value messages of the last
+    # round (MGM2 agents read them one iteration behind)
+    def restore_agents(self, values):
+        for agent in self.agents:
+            agent.value = int(values[agent.id])
+            agent.iteration = self.iteration
+        if self.iteration == 0:
+            return
+        stamp = self.iteration - 1 if self.agent_type == 'MGM2' else self.iteration
+        for agent in self.agents:
+            for neighbor in agent.neighbors:
+                agent.update_neighbor_value(neighbor.id, neighbor.value)
+                neighbor.mailbox.append(Message(agent.id, neighbor.id, agent.value, stamp, "value"))
 
     def compute_global_cost(self):
+        if self.vectorized is not None:
+            return self.vectorized.compute_global_cost()
+
         total = 0
         counted = set()
         for agent in self.agents:
@@ -102,39 +411,136 @@ class Simulation:
                 matrix = agent.cost_matrices[neighbor.id]
                 i = agent.domain.index(agent.value)
                 j = neighbor.domain.index(neighbor.value)
-                total += matrix[i][j]
+                total += int(matrix[i][j])
                 counted.add(key)
         return total
 
-# Plot global cost histories for different algorithms
-def plot_costs(all_histories,indices, k):
-    plt.figure()
-    all_values = []
-
-    # Plot DSA histories (record every iteration)
-    dsa_histories = all_histories.get("DSA", {})
-    for p, history in dsa_histories.items():
-        plt.plot(indices, history, label=f"DSA p={p}", linewidth=0.6)
-        all_values.extend(history)
-
-    # Plot MGM (step every 2 iterations)
-    mgm_history = all_histories.get("MGM", {}).get(None)
-    if mgm_history:
-        plt.step(indices, mgm_history, where="post", label="MGM", linewidth=0.6)
-        all_values.extend(mgm_history)
-
-    # Plot MGM2 (step every 5 iterations)
-    mgm2_history = all_histories.get("MGM2", {}).get(None)
-    if mgm2_history:
-        plt.step(indices, mgm2_history, where="post", label="MGM2", linewidth=0.6)
-        all_values.extend(mgm2_history)
-
-    plt.xlabel("Iteration")
-    plt.ylabel("Global Cost")
-    plt.title(f"DSA vs MGM | p1={k}")
-    plt.legend()
-    plt.grid(True)
-    plt.tight_layout()
-    filename = f"DSA_vs_MGM_p1{k}.png"
-    plt.savefig(filename, dpi=300)
-    plt.show()
\ No newline at end of file
+
+# Runs one algorithm on a list of instances (same num_agents/domain_size) in lockstep on a single VectorizedEngine.
+# Instance b draws from its own random.Random(seeds[b]) (default: the instance seed), so its history is the same as
+# a numpy-engine Simulation run right after random.seed(seeds[b]); with streams=True it draws from the RandomStreams
+# of seeds[b] instead, like Simulation(..., seed=seeds[b]), a whole round at a time.
+# record_every: keep only iterations 0, k, 2k, ... of the history
+# patience: as in Simulation (values, or the cost for PLATEAU_RULE), per instance; a converged instance keeps its final
+# cost and the batch stops once all instances converged (converged_at is -1 for instances that did not)
+# checkpoint_path / checkpoint_every: save_checkpoint to this file every k iterations and when run() returns
+# damping / anytime: as in Simulation, for Max-Sum
+class BatchedSimulation:
+    def __init__(self, DCOPs, agent_type, p_dsa=None, seeds=None, record_every=1, patience=None, checkpoint_path=None,
+                 checkpoint_every=None, streams=False, damping=0.5, anytime=False):
+        self.DCOPs = list(DCOPs)
+        self.agent_type = agent_type
+        self.p_dsa = p_dsa
+        self.damping = damping
+        self.anytime = anytime
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        if seeds is None:
+            seeds = [DCOP.seed for DCOP in self.DCOPs]
+        self.seeds = list(seeds)
+        if streams:
+            self.vectorized = make_engine(self.DCOPs, agent_type, p_dsa, damping, anytime=anytime,
+                                          streams=RandomStreams(seeds, agent_type, self.DCOPs[0].num_agents))
+        else:
+            self.vectorized = make_engine(self.DCOPs, agent_type, p_dsa, damping, anytime=anytime,
+                                          rngs=[random.Random(s) for s in seeds])
+        self.iteration = 0
+        self.record_every = record_every
+        self.recorder = HistoryRecorder(0, record_every, instances=len(self.DCOPs), dtype=np.int64)
+        self.patience = patience
+        self.global_cost = self.vectorized.instance_costs.copy()
+        self.last_change = np.zeros(len(self.DCOPs), dtype=np.int64)
+        self.converged_at = np.full(len(self.DCOPs), -1, dtype=np.int64)
+        self.moves = self.vectorized.moves.copy()
+
+    # (instances, recorded iterations)
+    @property
+    def history(self):
+        return self.recorder.finish()
+
+    def run(self, steps):
+        self.recorder.extend(steps)
+        while self.iteration < steps:
+            self.update_convergence()
+            self.recorder.record(self.iteration + 1, self.global_cost)
+            if self.patience and (self.converged_at >= 0).all():
+                self.recorder.fill(self.global_cost)
+                self.iteration = steps
+                break
+            self.iteration += 1
+            self.vectorized.step(self.iteration)
+            if self.checkpoint_path and self.checkpoint_every and self.iteration % self.checkpoint_every == 0:
+                self.save_checkpoint(self.checkpoint_path)
+        if self.checkpoint_path:
+            self.save_checkpoint(self.checkpoint_path)
+
+    def update_convergence(self):
+        costs = self.vectorized.instance_costs.copy()
+        if not self.patience:
+            self.global_cost = costs
+            return
+        running = self.converged_at < 0
+        if self.agent_type in PLATEAU_RULE:
+            changed = costs != self.global_cost
+        else:
+            changed = self.vectorized.moves != self.moves
+            self.moves = self.vectorized.moves.copy()
+        self.last_change[changed & running] = self.iteration
+        converged = running & (self.iteration - self.last_change >= self.patience * CYCLE_LENGTH[self.agent_type])
+        self.converged_at[converged] = self.last_change[converged]
+        self.global_cost = np.where(running, costs, self.global_cost)
+
+    # Mean global cost over the instances at every recorded iteration
+    def average_history(self):
+        return self.history.mean(axis=0)
+
+    def save_checkpoint(self, path):
+        arrays = {'history': self.history, 'global_cost': self.global_cost,
+                  'last_change': self.last_change, 'converged_at': self.converged_at}
+        if self.vectorized.streams is None:
+            arrays.update(rng_state(self.vectorized.rngs))
+        engine_state = dict(self.vectorized.get_state())
+        arrays['values'] = engine_state.pop('values')
+        arrays.update(('engine_' + name, array) for name, array in engine_state.items())
+        meta = {'kind': 'BatchedSimulation', 'agent_type': self.agent_type, 'p_dsa': self.p_dsa,
+                'iteration': self.iteration, 'record_every': self.record_every, 'patience': self.patience,
+                'seeds': self.seeds, 'streams': self.vectorized.streams is not None, 'damping': self.damping,
+                'anytime': self.anytime, 'instances': [instance_params(DCOP) for DCOP in self.DCOPs]}
+        write_checkpoint(path, meta, arrays)
+
+    # As Simulation.from_checkpoint; DCOPs defaults to regenerating every instance
+    @classmethod
+    def from_checkpoint(cls, path, DCOPs=None, agent_type=None, p_dsa=None, **kwargs):
+        meta, arrays = read_checkpoint(path)
+        if meta.get('kind') != 'BatchedSimulation':
+            raise ValueError(f"{path} is not a BatchedSimulation checkpoint")
+        if DCOPs is None:
+            DCOPs = [DCOPInstance(*params) for params in meta['instances']]
+        agent_type = agent_type or meta['agent_type']
+        forked = agent_type != meta['agent_type']
+        p_dsa = resumed_p_dsa(meta, agent_type, p_dsa)
+        kwargs.setdefault('record_every', meta['record_every'])
+        kwargs.setdefault('patience', meta['patience'])
+        kwargs.setdefault('seeds', meta['seeds'])
+        kwargs.setdefault('streams', meta['streams'])
+        kwargs.setdefault('damping', meta.get('damping', 0.5))
+        kwargs.setdefault('anytime', meta.get('anytime', False))
+        simulation = cls(DCOPs, agent_type, p_dsa, **kwargs)
+        if forked:
+            check_fork(meta['iteration'], meta['agent_type'], simulation.agent_type)
+        simulation.iteration = meta['iteration']
+        simulation.recorder.load(arrays['history'])
+        simulation.global_cost = arrays['global_cost']
+        simulation.last_change = arrays['last_change']
+        simulation.converged_at = arrays['converged_at']
+        engine = simulation.vectorized
+        if forked:
+            engine.set_values(arrays['values'])
+            engine.clear_cycle_state()
+        else:
+            engine.set_state(dict({name[len('engine_'):]: array for name, array in arrays.items()
+                                   if name.startswith('engine_')}, values=arrays['values']))
+        engine.iteration = simulation.iteration
+        if 'rng_words' in arrays:
+            set_rng_state(engine.rngs, arrays)
+        return simulation
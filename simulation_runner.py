@@ -1,8 +1,8 @@
+import os
 import random
-import numpy as np
-from DCOP import DCOPInstance
-from agents import Agent, DSAAgent
-from simulation import Simulation, plot_costs
+from DCOP import InstanceStore
+from experiments import ExperimentExecutor, Job, ResultCache
+from recording import ResultsWriter
 
 if __name__ == '__main__':
     p1 = [0.2,0.5] # 0.2, 0.5
@@ -11,35 +11,26 @@ if __name__ == '__main__':
         ("DSA", 0.7),
         ("MGM", None),
         ("MGM2", None),
+        ("MaxSum", None),
     ]
+    # Stop a run once no value has changed for this many cycles. Only MGM's stop is exact (after one quiet cycle it
+    # never moves again); the others run full length so their curves are not cut short.
+    patience = {"DSA": None, "MGM": 1, "MGM2": None, "MaxSum": None}
+    os.makedirs("results", exist_ok=True)
+    # Runs already done with the same instance, parameters and agent code are read back instead of rerun
+    cache = ResultCache(os.path.join("results", "cache"))
 
     for p in p1:
-        all_histories = {}
-        problem_instances = [DCOPInstance(30, 10, p,1, seed=random.randint(1,100000)) for run in range(50)]
-        for algorithm, pdsa in algorithms:
-            print(algorithm)
-            histories = []
-            problem_num = 1
-            for DCOP in problem_instances:
-                print("problem:",problem_num)
-                problem_num+=1
-                Sim = Simulation(DCOP, algorithm, p_dsa=pdsa)
-                Sim.run(steps=1000)
-                histories.append(Sim.history)
-            # Compute average history across runs
-            avg_history = []
-            max_len = max(len(h) for h in histories)
-            for t in range(max_len):
-                values_at_t = [h[t] if t < len(h) else h[-1] for h in histories]
-                avg_history.append(sum(values_at_t) / len(values_at_t))
-
-            sample_step = space
-            sampled_indices = list(range(0, len(avg_history), sample_step))
-            sampled_values = [avg_history[i] for i in sampled_indices]
-
-            all_histories.setdefault(algorithm, {})[pdsa] = sampled_values
-
-        plot_costs(all_histories,sampled_indices, p)
-
-
-
+        # Same instance seeds on every rerun, so unchanged jobs come from the cache
+        seed_source = random.Random(f"instances:{p}")
+        seeds = [seed_source.randint(1,100000) for run in range(50)]
+        jobs = [Job(30, 10, p, 1, seed, algorithm, pdsa, 1000, space, patience[algorithm])
+                for algorithm, pdsa in algorithms for seed in seeds]
+        # Histories arrive already sampled every `space` iterations; plot them with `python plotting.py <file>`
+        writer = ResultsWriter()
+        for result in ExperimentExecutor(store=InstanceStore("instances"), cache=cache).run(jobs):
+            writer.add(result)
+        path = os.path.join("results", f"DSA_vs_MGM_p1{p}.npz")
+        writer.save(path)
+        writer.close()
+        print("Results written to", path)
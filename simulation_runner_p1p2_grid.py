@@ -1,9 +1,9 @@
-import random
+import os
 import numpy as np
-from DCOP import DCOPInstance
-from agents import Agent, DSAAgent
-from simulation import Simulation, plot_costs
-import matplotlib.pyplot as plt
+from DCOP import InstanceStore
+from experiments import ExperimentExecutor, AdaptiveSweep, ResultCache
+from recording import ResultsWriter
+
 if __name__ == '__main__':
     p1 = [0.2]
     p2 = np.linspace(0.1, 1, 10)
@@ -11,55 +11,28 @@ if __name__ == '__main__':
         ("DSA", 0.7),
         ("MGM", None),
         ("MGM2", None),
+        ("MaxSum", None),
     ]
+    # Stop a run once no value has changed for this many cycles. Only MGM's stop is exact (after one quiet cycle it
+    # never moves again); the others run full length so their curves are not cut short.
+    patience = {"DSA": None, "MGM": 1, "MGM2": None, "MaxSum": None}
+    os.makedirs("results", exist_ok=True)
+    # Runs already done with the same instance, parameters and agent code are read back instead of rerun
+    cache = ResultCache(os.path.join("results", "cache"))
 
     for p_1 in p1:
-        all_costs = {}
-        for p_2 in p2:
-            print("p2:",p_2)
-            all_costs[p_2] = {}
-            problem_instances = [DCOPInstance(30, 10, p_1, p_2, seed=random.randint(1,100000)) for run in range(50)]
-            for alg_name, pdsa in algorithms:
-                print("alg:", alg_name)
-                costs = []
-                pr_number = 1
-                for dcop in problem_instances:
-                    print("problem:", pr_number)
-                    pr_number += 1
-                    Sim = Simulation(dcop, alg_name, p_dsa=pdsa)
-                    Sim.run(steps=125)
-                    costs.append(Sim.global_cost)
-
-                total_cost = sum(costs)/ len(costs)
-                all_costs[p_2][alg_name] = total_cost
-
-
-        def plot_all_costs(all_costs_dict):
-            plt.figure()  # יצירת חלון חדש לכל p1
-            x_vals = sorted(all_costs_dict.keys())
-
-            if not x_vals:
-                print("No data to plot")
-                return
-
-            first_key = x_vals[0]
-            algs = list(all_costs_dict[first_key].keys())
-
-            for alg in algs:
-                y_vals = [all_costs_dict[x][alg] for x in x_vals]
-                plt.plot(x_vals, y_vals, marker='o', label=alg)
-
-            plt.xlabel('p2')
-            plt.ylabel('Total Cost')
-            plt.title(f'Costs vs p2 (p1={p_1})')
-            plt.legend()
-            plt.grid(True)
-            plt.show()
-
-
-        plot_all_costs(all_costs)
-
-
-
-
-
+        # Instances are added per p2 in batches of 10 (shared by all algorithms) until every algorithm's 95% interval
+        # on the mean final cost is within ±10% of the mean or ±0.5 (near-zero means), up to 50 instances
+        writer = ResultsWriter()
+        sweep = AdaptiveSweep([(30, 10, p_1, p_2) for p_2 in p2], algorithms, 125, target_width=1, relative_width=0.2,
+                              batch_size=10, min_runs=10, max_runs=50, patience=patience,
+                              executor=ExperimentExecutor(store=InstanceStore("instances"), cache=cache),
+                              on_result=writer.add)
+        for ((_, _, _, p_2), (alg_name, pdsa)), stats in sweep.run().items():
+            print(f"p2={p_2:.1f} {alg_name}: {stats['runs']} instances, "
+                  f"mean {stats['mean']:.1f} ± {stats['half_width']:.1f}")
+        # Final costs against p2 are plotted with `python plotting.py <file>`
+        path = os.path.join("results", f"p1p2_grid_p1{p_1}.npz")
+        writer.save(path)
+        writer.close()
+        print("Results written to", path)
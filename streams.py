@@ -0,0 +1,91 @@
+import numpy as np
+
+# ------------------------------------------------- Random Streams -----------------------------------------------------
+
+ALGORITHM_IDS = {'DSA': 1, 'MGM': 2, 'MGM2': 3, 'MaxSum': 4}
+
+# Uniforms every agent gets per round: ACCEPT decides whether to move at all (DSA's p_dsa, MGM2's proposal coin),
+# PICK chooses among the options (equally good values, neighbors to propose to, proposals received)
+ACCEPT, PICK = 0, 1
+SLOTS = 2
+
+
+# Counter-based random numbers for the agents of one or more instances, replacing the global `random` module.
+# Rounds come in chunks of ROUNDS_PER_DRAW: chunk c of an instance is one (block_size, ROUNDS_PER_DRAW, SLOTS) array
+# drawn in bulk from a Philox Generator keyed by (instance seed, algorithm) with its counter at c, and agent i reads
+# row i. A draw therefore depends only on (instance seed, algorithm, agent, round): not on the number of agents or
+# instances run together, the process or the order rounds are asked for. Round 0 (before the first iteration) gives
+# the initial values.
+# agents: ascending ids of the only agents of each block to draw for (default all), e.g. a shard's own agents; draws
+# then has just their rows. Their rows are generated in spans, skipping the counter past the gaps between them
+# (shorter gaps are drawn and dropped, which is cheaper than restarting the generator).
+class RandomStreams:
+    ROUNDS_PER_DRAW = 32  # Part of the definition of the streams: changing it changes every draw
+    COUNTERS_PER_AGENT = ROUNDS_PER_DRAW * SLOTS // 4  # Philox gives four 64-bit words, i.e. uniforms, per counter
+    MIN_GAP = 8  # Rows skipped by advancing the counter rather than drawing them
+    ROWS_KEPT = 4
+
+    def __init__(self, seeds, algorithm, block_size, agents=None):
+        self.seeds = list(seeds)
+        self.algorithm = algorithm
+        self.block_size = block_size
+        self.keys = [np.random.SeedSequence([seed, ALGORITHM_IDS[algorithm]]).generate_state(2, np.uint64)
+                     for seed in self.seeds]
+        self.spans = self.span_rows = None
+        if agents is not None:
+            agents = np.asarray(agents, dtype=np.int64)
+            first = np.diff(agents, prepend=-self.MIN_GAP - 1) > self.MIN_GAP  # Agents that open a span
+            last = np.append(first[1:], True)[:len(agents)]
+            starts, stops = agents[first], agents[last] + 1
+            self.spans = list(zip(starts.tolist(), stops.tolist()))
+            # Row of each agent among the rows of all spans
+            span = np.cumsum(first) - 1
+            self.span_rows = agents - starts[span] + (np.cumsum(stops - starts) - (stops - starts))[span]
+        self.blocks = {}  # Chunk -> its draws, for the last chunks asked for
+        self.rows = {}  # Round -> agent_draws(round), for the last rounds asked for
+
+    def generator(self, key, chunk):
+        return np.random.Generator(np.random.Philox(key=key, counter=[0, chunk, 0, 0]))
+
+    # One instance's rows of a chunk, (block_size or len(agents), ROUNDS_PER_DRAW, SLOTS)
+    def chunk_rows(self, key, chunk):
+        generator = self.generator(key, chunk)
+        if self.spans is None:
+            return generator.random((self.block_size, self.ROUNDS_PER_DRAW, SLOTS))
+        rows, position = [], 0
+        for start, stop in self.spans:
+            generator.bit_generator.advance((start - position) * self.COUNTERS_PER_AGENT)
+            rows.append(generator.random((stop - start, self.ROUNDS_PER_DRAW, SLOTS)))
+            position = stop
+        return np.concatenate(rows + [np.zeros((0, self.ROUNDS_PER_DRAW, SLOTS))])[self.span_rows]
+
+    # Uniforms of every agent (or of `agents`) for one round, shape (instances * agents, SLOTS). The last two chunks
+    # are kept, so agents a round apart (AsyncRuntime) around a chunk boundary don't regenerate them in turn.
+    def draws(self, round):
+        chunk = round // self.ROUNDS_PER_DRAW
+        if chunk not in self.blocks:
+            self.blocks = {c: block for c, block in self.blocks.items() if abs(c - chunk) == 1}
+            self.blocks[chunk] = np.concatenate([self.chunk_rows(key, chunk) for key in self.keys])
+        return self.blocks[chunk][:, round % self.ROUNDS_PER_DRAW]
+
+    # draws(round) as nested lists, for agent objects reading one value at a time; kept for the last few rounds
+    # asked for, as agents of an AsyncRuntime run different rounds at the same time
+    def agent_draws(self, round):
+        if round not in self.rows:
+            self.rows = {r: rows for r, rows in self.rows.items() if abs(r - round) <= self.ROWS_KEPT}
+            self.rows[round] = self.draws(round).tolist()
+        return self.rows[round]
+
+    # Index in [0, count) from a uniform, elementwise
+    @staticmethod
+    def pick(uniforms, count):
+        return np.minimum((uniforms * count).astype(np.int64), np.maximum(count - 1, 0))
+
+    # Uniforms fixed for the whole run, `count` per agent, shape (instances * block_size, count); drawn with the third
+    # counter word set, so they never overlap the rounds' draws (e.g. Max-Sum's tie-breaking preferences)
+    def fixed_draws(self, count):
+        return np.concatenate([np.random.Generator(np.random.Philox(key=key, counter=[0, 0, 1, 0]))
+                               .random((self.block_size, count)) for key in self.keys])
+
+    def initial_values(self, domain_size):
+        return self.pick(self.draws(0)[:, PICK], domain_size)
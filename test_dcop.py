@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+import os
+from DCOP import DCOPInstance, atomic_write
+from simulation import Simulation
+
+# ------------------------------------------------ Instance Storage ----------------------------------------------------
+
+EDGES = np.array([[0, 1], [1, 2], [0, 2]])
+
+
+def tensor(values, dtype):
+    return np.array(values, dtype=dtype).reshape(len(EDGES), 2, 2)
+
+
+# Integer costs are narrowed to the smallest dtype that holds them, anything else is stored as given; either way
+# from_arrays and save/load give back exactly the costs passed in
+@pytest.mark.parametrize("costs, dtype, stored", [
+    (np.arange(12) * 1000.25, np.float64, np.float64),
+    (np.arange(12) - 200, np.int64, np.int16),
+    (np.arange(12) * 20, np.int64, np.uint8),
+])
+def test_costs_round_trip(tmp_path, costs, dtype, stored):
+    cost_tensor = tensor(costs, dtype)
+    instance = DCOPInstance.from_arrays(3, 2, EDGES, cost_tensor)
+    assert instance.cost_tensor.dtype == stored
+    assert np.array_equal(instance.cost_tensor, cost_tensor)
+    path = str(tmp_path / "instance")
+    instance.save(path)
+    for mmap in (True, False):
+        loaded = DCOPInstance.load(path, mmap=mmap)
+        assert loaded.cost_tensor.dtype == stored
+        assert np.array_equal(loaded.cost_tensor, cost_tensor)
+
+
+# A second save of the same instance keeps the first; a failed write leaves neither the file nor its temporary
+def test_atomic_write(tmp_path):
+    instance = DCOPInstance.from_arrays(3, 2, EDGES, tensor(np.arange(12), np.int64))
+    path = str(tmp_path / "instance")
+    instance.save(path)
+    instance.save(path)
+    assert os.listdir(tmp_path) == ["instance"]
+    assert np.array_equal(DCOPInstance.load(path).cost_tensor, instance.cost_tensor)
+
+    def fail(tmp):
+        with open(tmp, "w") as f:
+            f.write("partial")
+        raise RuntimeError("disk full")
+    with pytest.raises(RuntimeError):
+        atomic_write(str(tmp_path / "file"), fail)
+    assert os.listdir(tmp_path) == ["instance"]
+
+
+def test_float_costs_are_not_simulated():
+    instance = DCOPInstance.from_arrays(3, 2, EDGES, tensor(np.arange(12) + 0.5, np.float64))
+    for engine in ('objects', 'numpy'):
+        with pytest.raises(ValueError):
+            Simulation(instance, 'MGM', engine=engine)
+
+
+def test_negative_costs_are_simulated():
+    instance = DCOPInstance.from_arrays(3, 2, EDGES, tensor(np.arange(12) - 200, np.int64))
+    objects = Simulation(instance, 'MGM', seed=1, check_every=1)
+    objects.run(10)
+    vectorized = Simulation(instance, 'MGM', engine='numpy', seed=1, check_every=1)
+    vectorized.run(10)
+    assert objects.history == vectorized.history
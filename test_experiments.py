@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+from DCOP import DCOPInstance, InstanceStore
+from experiments import AdaptiveSweep, Job, JobResult, ResultCache, confidence_interval
+
+# ------------------------------------------------ Caches and Stores ---------------------------------------------------
+
+JOB = Job(10, 3, 0.5, 1, 1, 'MGM', None, 50, 10, 1)
+
+
+def result(job, final_cost=7):
+    return JobResult(job, np.arange(5), final_cost, None)
+
+
+def test_cache_key_includes_code_version(tmp_path):
+    root = str(tmp_path)
+    cache = ResultCache(root, version="a")
+    cache.put(result(JOB))
+    assert ResultCache(root, version="a").get(JOB).final_cost == 7
+    changed = ResultCache(root, version="b")
+    assert JOB not in changed and changed.get(JOB) is None
+    assert cache.key(JOB) != changed.key(JOB)
+
+
+# The entry read last survives, the one used longest ago goes once the cache holds more bytes than max_bytes
+def test_cache_evicts_least_recently_used_bytes(tmp_path):
+    jobs = [JOB._replace(seed=seed) for seed in range(3)]
+    probe = ResultCache(str(tmp_path / "probe"), version="a")
+    probe.put(result(jobs[0]))
+    size = probe.size
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=int(2.5 * size), version="a")
+    cache.put(result(jobs[0]))
+    cache.put(result(jobs[1]))
+    cache.get(jobs[0])
+    cache.put(result(jobs[2]))
+    assert [job in cache for job in jobs] == [True, False, True]
+    assert cache.size == 2 * size
+    assert len(ResultCache(str(tmp_path / "cache"), version="a")) == 2
+
+
+def test_instance_store_reuses_instances(tmp_path, monkeypatch):
+    store = InstanceStore(str(tmp_path))
+    params = (20, 4, 0.3, 1, 5)
+    first = store.get(*params)
+    assert params in store
+
+    def regenerate(*args, **kwargs):
+        raise AssertionError("stored instance generated again")
+    monkeypatch.setattr(DCOPInstance, '__init__', regenerate)
+    again = store.get(*params)
+    assert np.array_equal(again.edges, first.edges) and np.array_equal(again.cost_tensor, first.cost_tensor)
+    assert (20, 4, 0.3, 1, 6) not in store
+
+
+# ------------------------------------------------- Adaptive Sweeps ----------------------------------------------------
+
+# Executor whose final costs are a fixed function of the instance seed, so a sweep runs without simulating
+class CostExecutor:
+    def __init__(self, cost):
+        self.cost = cost
+        self.jobs = 0
+
+    def run(self, jobs):
+        for job in jobs:
+            self.jobs += 1
+            yield JobResult(job, [], self.cost(job.seed), None)
+
+
+POINTS = [(10, 3, 0.5, 1), (10, 3, 0.2, 1)]
+ALGORITHMS = [('MGM', None), ('DSA', 0.7)]
+
+
+def sweep(cost, **kwargs):
+    executor = CostExecutor(cost)
+    kwargs = dict(dict(batch_size=5, min_runs=10, max_runs=100), **kwargs)
+    return AdaptiveSweep(POINTS, ALGORITHMS, 50, executor=executor, **kwargs), executor
+
+
+def test_sweep_stops_at_min_runs_without_variance():
+    adaptive, executor = sweep(lambda seed: 3, target_width=0.1)
+    summary = adaptive.run()
+    assert all(entry["runs"] == 10 and entry["half_width"] == 0 for entry in summary.values())
+    assert executor.jobs == 10 * len(POINTS) * len(ALGORITHMS)
+
+
+# Every point stops at the first batch after which the interval of every algorithm is narrow enough
+@pytest.mark.parametrize("kwargs", [{'target_width': 4}, {'relative_width': 0.3}])
+def test_sweep_stops_once_intervals_are_narrow(kwargs):
+    adaptive, _ = sweep(lambda seed: seed % 10 + 5, **kwargs)
+    adaptive.run()
+
+    def narrow(samples):
+        mean, half_width = confidence_interval(samples)
+        return 2 * half_width <= max(kwargs.get('target_width', 0), kwargs.get('relative_width', 0) * abs(mean))
+
+    for point in POINTS:
+        runs = len(adaptive.seeds[point])
+        assert 10 < runs < 100
+        assert all(narrow(adaptive.samples(point, algorithm)) for algorithm in ALGORITHMS)
+        assert not all(narrow(adaptive.samples(point, algorithm)[:runs - 5]) for algorithm in ALGORITHMS)
+
+
+def test_sweep_stops_at_max_runs():
+    adaptive, _ = sweep(lambda seed: seed % 10, target_width=1e-6, max_runs=23)
+    summary = adaptive.run()
+    assert all(entry["runs"] == 23 for entry in summary.values())
+    assert all(len(set(seeds)) == 23 for seeds in adaptive.seeds.values())
@@ -0,0 +1,173 @@
+import random
+import numpy as np
+import pytest
+from DCOP import DCOPInstance
+from simulation import Simulation, BatchedSimulation
+from sharded import ShardedSimulation
+from async_runtime import AsyncRuntime
+from recording import HistoryRecorder
+
+# ------------------------------------------------- Parity Checks ------------------------------------------------------
+
+# Every way of running an algorithm must give the same run as the object engine under the same seed: these small
+# seeded instances pin that down for each engine, batching, sharding, checkpoints and the active-set schedule.
+
+ALGORITHMS = [('DSA', 0.7), ('DSA', 1), ('MGM', None), ('MGM2', None)]
+
+
+def instance(seed=3, num_agents=30, p1=0.2, p2=1):
+    return DCOPInstance(num_agents, 5, p1, p2, seed)
+
+
+def run(steps, *args, **kwargs):
+    simulation = Simulation(*args, **kwargs)
+    simulation.run(steps)
+    return simulation
+
+
+@pytest.mark.parametrize("agent_type, p_dsa", ALGORITHMS)
+def test_numpy_engine_matches_objects(agent_type, p_dsa):
+    DCOP = instance()
+    objects = run(40, DCOP, agent_type, p_dsa, seed=11)
+    vectorized = run(40, DCOP, agent_type, p_dsa, engine='numpy', seed=11)
+    assert objects.history == vectorized.history
+    assert [agent.value for agent in objects.agents] == vectorized.vectorized.values.tolist()
+
+
+@pytest.mark.parametrize("agent_type, p_dsa", ALGORITHMS)
+def test_numpy_engine_matches_objects_with_global_random(agent_type, p_dsa):
+    DCOP = instance()
+    random.seed(5)
+    objects = run(30, DCOP, agent_type, p_dsa)
+    random.seed(5)
+    vectorized = run(30, DCOP, agent_type, p_dsa, engine='numpy')
+    assert objects.history == vectorized.history
+
+
+@pytest.mark.parametrize("agent_type, p_dsa", ALGORITHMS + [('MaxSum', None)])
+@pytest.mark.parametrize("streams", [True, False])
+def test_batched_matches_single(agent_type, p_dsa, streams):
+    DCOPs = [instance(seed) for seed in range(3)]
+    batched = BatchedSimulation(DCOPs, agent_type, p_dsa, seeds=[7, 8, 9], streams=streams)
+    batched.run(30)
+    for b, DCOP in enumerate(DCOPs):
+        if streams:
+            single = run(30, DCOP, agent_type, p_dsa, engine='numpy', seed=7 + b)
+        else:
+            random.seed(7 + b)
+            single = run(30, DCOP, agent_type, p_dsa, engine='numpy')
+        assert batched.history[b].tolist() == single.history
+
+
+# Both downsample through HistoryRecorder: same samples, also when the batch stops early or runs in two parts
+@pytest.mark.parametrize("record_every", [1, 7])
+@pytest.mark.parametrize("patience", [None, 1])
+def test_batched_recording_matches_single(record_every, patience):
+    DCOPs = [instance(seed) for seed in range(3)]
+    batched = BatchedSimulation(DCOPs, 'MGM', seeds=[7, 8, 9], streams=True, record_every=record_every,
+                                patience=patience)
+    batched.run(13)
+    batched.run(60)
+    for b, DCOP in enumerate(DCOPs):
+        recorder = HistoryRecorder(60, record_every)
+        Simulation(DCOP, 'MGM', engine='numpy', seed=7 + b, recorder=recorder, patience=patience).run(60)
+        assert batched.history[b].tolist() == recorder.finish().tolist()
+
+
+@pytest.mark.parametrize("agent_type, p_dsa", [('DSA', 0.7), ('MGM', None)])
+@pytest.mark.parametrize("seed", [11, None])
+def test_sharded_matches_single(agent_type, p_dsa, seed):
+    DCOP = instance(num_agents=60, p1=0.1)
+    random.seed(4)
+    single = run(30, DCOP, agent_type, p_dsa, engine='numpy', seed=seed)
+    random.seed(4)
+    sharded = ShardedSimulation(DCOP, agent_type, p_dsa, num_workers=3, seed=seed)
+    try:
+        sharded.run(13)
+        sharded.run(30)
+        assert sharded.history == [int(cost) for cost in single.history]
+        assert (sharded.values == single.vectorized.values).all()
+    finally:
+        sharded.close()
+
+
+# Random per-message delays reorder deliveries, but every agent waits for its whole round, so with per-agent
+# streams the run ends where the synchronous one does
+@pytest.mark.parametrize("agent_type, p_dsa", ALGORITHMS)
+@pytest.mark.parametrize("steps", [7, 30])
+def test_async_runtime_matches_simulation(agent_type, p_dsa, steps):
+    DCOP = instance()
+    delays = random.Random(steps)
+    runtime = AsyncRuntime(DCOP, agent_type, p_dsa, delay=lambda: delays.random() * 0.001, seed=9)
+    stats = runtime.run(steps)
+    simulation = run(steps, DCOP, agent_type, p_dsa, seed=9)
+    assert stats['final_cost'] == simulation.compute_global_cost()
+    assert [agent.value for agent in runtime.agents] == [agent.value for agent in simulation.agents]
+
+
+@pytest.mark.parametrize("agent_type, p_dsa", ALGORITHMS + [('MaxSum', None)])
+@pytest.mark.parametrize("engine", ['objects', 'numpy'])
+def test_checkpoint_resume(tmp_path, agent_type, p_dsa, engine):
+    if agent_type == 'MaxSum' and engine == 'objects':
+        pytest.skip("Max-Sum runs only on the numpy engine")
+    DCOP = instance()
+    path = str(tmp_path / "run.npz")
+    full = run(40, DCOP, agent_type, p_dsa, engine=engine, seed=11)
+    run(20, DCOP, agent_type, p_dsa, engine=engine, seed=11, checkpoint_path=path, checkpoint_every=10)
+    resumed = Simulation.from_checkpoint(path)
+    resumed.run(40)
+    assert resumed.history == full.history
+
+
+# Only the engine changes: the run goes on exactly as if it had stayed on the first one
+@pytest.mark.parametrize("engine, other", [('objects', 'numpy'), ('numpy', 'objects')])
+@pytest.mark.parametrize("seed", [11, None])
+def test_fork_to_other_engine(tmp_path, engine, other, seed):
+    DCOP = instance()
+    path = str(tmp_path / "run.npz")
+    random.seed(2)
+    full = run(40, DCOP, 'DSA', 0.7, engine=engine, seed=seed)
+    random.seed(2)
+    run(20, DCOP, 'DSA', 0.7, engine=engine, seed=seed, checkpoint_path=path, checkpoint_every=10)
+    forked = Simulation.from_checkpoint(path, DCOP, agent_type='DSA', engine=other)
+    assert forked.p_dsa == 0.7
+    forked.run(40)
+    assert forked.history == full.history
+
+
+def test_fork_into_dsa_needs_p_dsa(tmp_path):
+    path = str(tmp_path / "run.npz")
+    run(20, instance(), 'MGM', engine='numpy', seed=11, checkpoint_path=path, checkpoint_every=10)
+    with pytest.raises(ValueError):
+        Simulation.from_checkpoint(path, agent_type='DSA')
+    assert Simulation.from_checkpoint(path, agent_type='DSA', p_dsa=0.5).p_dsa == 0.5
+
+
+def test_batched_checkpoint_resume(tmp_path):
+    DCOPs = [instance(seed) for seed in range(3)]
+    path = str(tmp_path / "batch.npz")
+    full = BatchedSimulation(DCOPs, 'MGM2', seeds=[1, 2, 3], streams=True)
+    full.run(40)
+    partial = BatchedSimulation(DCOPs, 'MGM2', seeds=[1, 2, 3], streams=True, checkpoint_path=path)
+    partial.run(17)
+    resumed = BatchedSimulation.from_checkpoint(path)
+    resumed.run(40)
+    assert np.array_equal(resumed.history, full.history)
+
+
+@pytest.mark.parametrize("agent_type, p_dsa", [('DSA', 0.7), ('DSA', 1), ('MGM', None)])
+def test_active_set_matches_full_schedule(agent_type, p_dsa):
+    DCOP = instance(num_agents=80, p1=0.05)
+    full = run(60, DCOP, agent_type, p_dsa, seed=11)
+    active = run(60, DCOP, agent_type, p_dsa, seed=11, active_set=True)
+    assert active.history == full.history
+    assert [agent.value for agent in active.agents] == [agent.value for agent in full.agents]
+
+
+# One MGM cycle without a move is a local optimum, so stopping there must not change the history
+@pytest.mark.parametrize("seed", range(5))
+def test_mgm_patience_is_exact(seed):
+    DCOP = instance(seed)
+    full = run(200, DCOP, 'MGM', engine='numpy', seed=seed)
+    early = run(200, DCOP, 'MGM', engine='numpy', seed=seed, patience=1)
+    assert early.history == full.history
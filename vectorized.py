@@ -0,0 +1,302 @@
+import random
+import numpy as np
+from streams import RandomStreams, ACCEPT, PICK
+from DCOP import check_integer_costs
+
+
+# ------------------------------------------------ Vectorized Engine ---------------------------------------------------
+
+# Runs synchronous DSA / MGM / MGM2 rounds for all agents at once with NumPy arrays.
+# Values, local cost vectors and reductions live in arrays indexed by agent id, and the constraint graph is the
+# instance's CSR adjacency over its stacked cost tensor (DCOPInstance.build_csr).
+# Random draws go through `random` (the global module, or one random.Random per stacked instance), in the same order
+# the agent objects make them, so under a fixed seed the cost trajectory is identical to the object engine. With a
+# RandomStreams they come from each agent's row of the round's block instead, exactly as the agent objects read them.
+class VectorizedEngine:
+    ALGORITHMS = ('DSA', 'MGM', 'MGM2')
+    # Methods a Profiler (instrumentation.py) times when attached
+    PROFILED_METHODS = ('dsa_round', 'mgm_phase1', 'mgm_phase2', 'mgm2_phase1', 'mgm2_phase2', 'mgm2_phase3',
+                        'mgm2_phase4', 'mgm2_phase5', 'get_best_values', 'set_values', 'has_maximal',
+                        'compute_global_cost')
+
+    # DCOP may also be a list of instances with the same num_agents/domain_size; they are then stacked as
+    # independent blocks of agents (agent b * num_agents + i is agent i of instance b) and advanced in lockstep.
+    # rngs gives one random source per instance (default: the global `random` module for all of them).
+    # streams: a RandomStreams to draw from instead, a whole round at a time (rngs is then unused)
+    def __init__(self, DCOP, agent_type, p_dsa=None, rngs=None, streams=None):
+        if agent_type not in self.ALGORITHMS:
+            raise ValueError("Unknown algorithm type")
+        instances = list(DCOP) if isinstance(DCOP, (list, tuple)) else [DCOP]
+        if any(inst.num_agents != instances[0].num_agents or inst.domain_size != instances[0].domain_size
+               for inst in instances):
+            raise ValueError("All instances must have the same num_agents and domain_size")
+        for inst in instances:
+            check_integer_costs(inst)
+        self.agent_type = agent_type
+        self.p_dsa = p_dsa
+        self.num_instances = len(instances)
+        self.block_size = instances[0].num_agents
+        self.num_agents = self.num_instances * self.block_size
+        self.domain_size = instances[0].domain_size
+        self.rngs = list(rngs) if rngs is not None else [random] * self.num_instances
+        self.streams = streams
+        self.iteration = 0
+
+        if streams is not None:
+            self.values = streams.initial_values(self.domain_size)
+        else:
+            # Same draws as Agent.set_initial_value, agent by agent
+            self.values = np.array([rng.choice(range(self.domain_size)) for rng in self.rngs
+                                    for _ in range(self.block_size)], dtype=np.int64)
+
+        # Stacked CSR adjacency of all instances: entry k is the directed edge src[k] -> dst[k] over constraint
+        # edge_ids[k] of cost_tensor, with `transposed[k]` set where src[k] is the column side of that matrix
+        src, dst, edge_ids, transposed, ends, tensors = [], [], [], [], [], []
+        num_edges = 0
+        for b, inst in enumerate(instances):
+            offset = b * self.block_size
+            src.append(np.repeat(np.arange(self.block_size), np.diff(inst.csr_offsets)) + offset)
+            dst.append(inst.csr_neighbors + offset)
+            edge_ids.append(inst.csr_edges + num_edges)
+            transposed.append(inst.csr_transposed)
+            ends.append(inst.edges + offset)
+            tensors.append(inst.cost_tensor)
+            num_edges += len(inst.edges)
+        self.src = np.concatenate(src).astype(np.int64)
+        self.dst = np.concatenate(dst).astype(np.int64)
+        self.edge_ids = np.concatenate(edge_ids).astype(np.int64)
+        self.transposed = np.concatenate(transposed).astype(bool)
+        self.edge_ends = np.concatenate(ends).astype(np.int64).reshape(num_edges, 2)
+        if len(tensors) == 1:
+            self.cost_tensor = tensors[0]  # Shared with the instance
+        else:
+            self.cost_tensor = np.concatenate(tensors).reshape(num_edges, self.domain_size, self.domain_size)
+        self.degree = np.bincount(self.src, minlength=self.num_agents)
+        self.offsets = np.concatenate(([0], np.cumsum(self.degree)))
+        self._edge_keys = self.src * self.num_agents + self.dst  # Sorted, for finding the edge between two agents
+        self._row_index = (self.src[:, None] * self.domain_size + np.arange(self.domain_size)).ravel()
+        self._edge_instance = self.edge_ends[:, 0] // self.block_size
+        self.instance_costs = self.compute_instance_costs()  # Updated by set_values from the edges that changed
+        self.moves = np.zeros(self.num_instances, dtype=np.int64)  # Value changes per instance so far (set_values)
+
+        # Kept up to date by set_values instead of being recomputed every round
+        self.local_costs = self.compute_local_costs(self.values)
+        self.current_costs = np.zeros((self.num_agents, self.domain_size), dtype=np.int64)
+        self.reduction = np.zeros(self.num_agents)
+        self.clear_cycle_state()
+
+    # MGM2 per-cycle state, reset after phase 5 like MGM2Agent.clear_attributes_after_cycle
+    def clear_cycle_state(self):
+        self.potential_partner = np.full(self.num_agents, -1, dtype=np.int64)
+        self.partner = np.full(self.num_agents, -1, dtype=np.int64)
+        self.best_assignment = self.values.copy()
+        self.has_maximal_reduction = np.zeros(self.num_agents, dtype=bool)
+        self.cycle_costs = None
+
+    # Arrays that fully describe the engine between two steps (for checkpoints); cycle_costs only mid MGM2 cycle
+    STATE = ('values', 'local_costs', 'instance_costs', 'current_costs', 'reduction', 'potential_partner', 'partner',
+             'best_assignment', 'has_maximal_reduction')
+
+    def get_state(self):
+        state = {name: getattr(self, name) for name in self.STATE}
+        if self.cycle_costs is not None:
+            state['cycle_costs'] = self.cycle_costs
+        return state
+
+    def set_state(self, state):
+        for name in self.STATE:
+            setattr(self, name, np.array(state[name]))
+        self.cycle_costs = np.array(state['cycle_costs']) if 'cycle_costs' in state else None
+
+    def compute_global_cost(self):
+        return self.compute_instance_costs().sum()
+
+    # Global cost of each stacked instance, shape (num_instances,)
+    def compute_instance_costs(self):
+        e = np.arange(len(self.edge_ends))
+        costs = self.cost_tensor[e, self.values[self.edge_ends[:, 0]], self.values[self.edge_ends[:, 1]]]
+        return np.bincount(self._edge_instance, weights=costs, minlength=self.num_instances).astype(np.int64)
+
+    # Cost rows of the agents on one side of constraints `e` given the value of the agent on the other side;
+    # column_side marks agents that are the column side of their matrix
+    def edge_rows(self, e, column_side, other_values):
+        rows = self.cost_tensor[e, :, other_values]
+        if column_side.any():
+            rows[column_side] = self.cost_tensor[e[column_side], other_values[column_side], :]
+        return rows
+
+    # Cost of every value of every agent given the neighbors' values, shape (num_agents, domain_size)
+    def compute_local_costs(self, values):
+        rows = self.edge_rows(self.edge_ids, self.transposed, values[self.dst])
+        costs = np.bincount(self._row_index, weights=rows.ravel(), minlength=self.num_agents * self.domain_size)
+        return costs.reshape(self.num_agents, self.domain_size).astype(np.int64)
+
+    # Move agents to `values`, patching local_costs of the neighbors of the agents that changed and the global
+    # cost of their instances
+    def set_values(self, values):
+        changed_mask = values != self.values
+        changed = np.flatnonzero(changed_mask)
+        if len(changed):
+            counts = self.degree[changed]
+            edges = np.arange(counts.sum()) + np.repeat(self.offsets[changed] - np.cumsum(counts) + counts, counts)
+            e, movers, neighbors = self.edge_ids[edges], self.src[edges], self.dst[edges]
+            neighbor_side = ~self.transposed[edges]
+            # Costs are stored compact (DCOP.cost_dtype): widen before subtracting
+            delta = (self.edge_rows(e, neighbor_side, values[movers]).astype(np.int64)
+                     - self.edge_rows(e, neighbor_side, self.values[movers]))
+            np.add.at(self.local_costs, neighbors, delta)
+
+            # Constraints between two movers show up from both ends; count them once
+            e = e[~changed_mask[neighbors] | (movers < neighbors)]
+            i, j = self.edge_ends[e, 0], self.edge_ends[e, 1]
+            edge_delta = (self.cost_tensor[e, values[i], values[j]].astype(np.int64)
+                          - self.cost_tensor[e, self.values[i], self.values[j]])
+            self.instance_costs += np.bincount(self._edge_instance[e], weights=edge_delta,
+                                               minlength=self.num_instances).astype(np.int64)
+            self.moves += np.bincount(changed // self.block_size, minlength=self.num_instances)
+        self.values = values
+
+    # Agent.get_best_value for every agent in `active` (all agents by default)
+    def get_best_values(self, costs, prob=1, active=None):
+        alternatives = costs == costs.min(axis=1)[:, None]
+        alternatives[np.arange(self.num_agents), self.values] = False
+        counts = alternatives.sum(axis=1)
+        if self.streams is not None:
+            draws = self.streams.draws(self.iteration)
+            move = counts > 0
+            if prob != 1:
+                move &= draws[:, ACCEPT] < prob
+            if active is not None:
+                move &= active
+            movers = np.flatnonzero(move)
+            picks = RandomStreams.pick(draws[movers, PICK], counts[movers])
+            best = self.values.copy()
+            ranks = np.cumsum(alternatives[movers], axis=1)
+            best[movers] = np.argmax(ranks > picks[:, None], axis=1)
+            return best
+
+        agents = np.arange(self.num_agents) if active is None else np.flatnonzero(active)
+        movers, picks = [], []
+        for i in agents.tolist():
+            rng = self.rngs[i // self.block_size]
+            if prob != 1 and not rng.random() < prob:
+                continue
+            if counts[i]:
+                movers.append(i)
+                picks.append(rng.choice(range(counts[i])))
+
+        best = self.values.copy()
+        if movers:
+            ranks = np.cumsum(alternatives[movers], axis=1)
+            best[movers] = np.argmax(ranks > np.array(picks)[:, None], axis=1)
+        return best
+
+    # Agent.decide_to_change over all agents: no neighbor with a larger reduction (ties go to the lower id)
+    def has_maximal(self, reduction, exclude=None):
+        mine, theirs = reduction[self.src], reduction[self.dst]
+        beaten = (theirs > mine) | ((theirs == mine) & (self.dst < self.src))
+        if exclude is not None:
+            beaten &= self.dst != exclude[self.src]
+        return np.bincount(self.src[beaten], minlength=self.num_agents) == 0
+
+    def step(self, iteration):
+        self.iteration = iteration
+        if self.agent_type == 'DSA':
+            self.dsa_round()
+        elif self.agent_type == 'MGM':
+            if iteration % 2 == 1:
+                self.mgm_phase1()
+            else:
+                self.mgm_phase2()
+        else:
+            phase = (iteration - 1) % 5
+            [self.mgm2_phase1, self.mgm2_phase2, self.mgm2_phase3, self.mgm2_phase4, self.mgm2_phase5][phase]()
+
+    def dsa_round(self):
+        self.current_costs = self.local_costs.copy()
+        self.set_values(self.get_best_values(self.current_costs, self.p_dsa))
+
+    def mgm_phase1(self):
+        self.current_costs = self.local_costs.copy()
+        best = self.get_best_values(self.current_costs)
+        rows = np.arange(self.num_agents)
+        self.reduction = self.current_costs[rows, self.values] - self.current_costs[rows, best]
+
+    def mgm_phase2(self):
+        maximal = self.has_maximal(self.reduction)
+        self.set_values(self.get_best_values(self.current_costs, active=maximal))
+
+    def mgm2_phase1(self):
+        self.cycle_costs = self.local_costs.copy()
+        # The first cycle reads value messages from iteration -1, so agents start it with all-zero costs
+        if self.iteration > 1:
+            self.current_costs = self.cycle_costs
+        else:
+            self.current_costs = np.zeros((self.num_agents, self.domain_size), dtype=np.int64)
+        if self.streams is not None:
+            draws = self.streams.draws(self.iteration)
+            proposing = np.flatnonzero((draws[:, ACCEPT] < 0.5) & (self.degree > 0))
+            k = RandomStreams.pick(draws[proposing, PICK], self.degree[proposing])
+            self.potential_partner[proposing] = self.dst[self.offsets[proposing] + k]
+            return
+        for i in range(self.num_agents):
+            rng = self.rngs[i // self.block_size]
+            if rng.random() < 0.5 and self.degree[i]:
+                k = rng.choice(range(self.degree[i]))
+                self.potential_partner[i] = self.dst[self.offsets[i] + k]
+
+    def mgm2_phase2(self):
+        proposers = np.flatnonzero(self.potential_partner >= 0)
+        targets = self.potential_partner[proposers]
+        order = np.lexsort((proposers, targets))
+        proposers, targets = proposers[order], targets[order]
+        counts = np.bincount(targets, minlength=self.num_agents)
+        first = np.concatenate(([0], np.cumsum(counts)))
+
+        receivers = np.flatnonzero((self.potential_partner < 0) & (counts > 0))
+        if len(receivers) == 0:
+            return
+        if self.streams is not None:
+            k = RandomStreams.pick(self.streams.draws(self.iteration)[receivers, PICK], counts[receivers])
+            partners = proposers[first[receivers] + k]
+        else:
+            chosen = [proposers[first[i] + self.rngs[i // self.block_size].choice(range(counts[i]))]
+                      for i in receivers.tolist()]
+            partners = np.array(chosen, dtype=np.int64)
+        self.partner[receivers] = partners
+        self.partner[partners] = receivers
+
+        # Best joint move of each pair as one d x d array per pair: both unary vectors without the constraint
+        # between the partners, plus that constraint counted once (rows: receiver's values)
+        k = np.searchsorted(self._edge_keys, receivers * self.num_agents + partners)
+        shared = self.cost_tensor[self.edge_ids[k]]
+        flip = self.transposed[k]
+        shared[flip] = shared[flip].transpose(0, 2, 1)
+        pairs = np.arange(len(receivers))
+        x_r, x_p = self.values[receivers], self.values[partners]
+        mine = self.cycle_costs[receivers] - shared[pairs, :, x_p]
+        theirs = self.cycle_costs[partners] - shared[pairs, x_r, :]
+        joint = (mine[:, :, None] + theirs[:, None, :] + shared).reshape(len(pairs), -1)
+        best = joint.argmin(axis=1)
+        self.best_assignment[receivers] = best // self.domain_size
+        self.best_assignment[partners] = best % self.domain_size
+        reduction = joint[pairs, x_r * self.domain_size + x_p] - joint[pairs, best]
+        self.reduction[receivers] = reduction
+        self.reduction[partners] = reduction
+
+    def mgm2_phase3(self):
+        alone = self.partner < 0
+        best = self.get_best_values(self.current_costs, active=alone)
+        rows = np.flatnonzero(alone)
+        self.best_assignment[rows] = best[rows]
+        self.reduction[rows] = self.current_costs[rows, self.values[rows]] - self.current_costs[rows, best[rows]]
+
+    def mgm2_phase4(self):
+        self.has_maximal_reduction = self.has_maximal(self.reduction, exclude=self.partner)
+
+    def mgm2_phase5(self):
+        paired = self.partner >= 0
+        confirmed = np.where(paired, self.has_maximal_reduction[np.where(paired, self.partner, 0)], True)
+        change = self.has_maximal_reduction & confirmed
+        self.set_values(np.where(change, self.best_assignment, self.values))
+        self.clear_cycle_state()